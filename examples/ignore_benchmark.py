@@ -0,0 +1,120 @@
+"""
+忽略规则匹配性能对比
+
+比较三种实现在大量规则、大量路径下的匹配耗时：
+    1. pathspec库(如果已安装)
+    2. 原来的备用实现：逐条规则匹配，最后匹配的规则生效
+    3. 当前的备用实现：IgnoreRules在没有pathspec时使用的规则索引和合并匹配器
+"""
+
+import os
+import re
+import sys
+import time
+import fnmatch
+import random
+
+# 添加父目录到路径，以便导入包
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.huangyz_sync.utils import ignore as ignore_module
+from src.huangyz_sync.utils.ignore import IgnoreRules
+
+def build_patterns(count):
+    """生成一组与实际忽略文件相似的规则"""
+    patterns = ["*.pyc", "*.tmp", "*.log", "__pycache__/", ".git/", "node_modules/", "build/", "dist/"]
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            patterns.append(f"*.ext{i}")
+        elif kind == 1:
+            patterns.append(f"cache{i}/")
+        elif kind == 2:
+            patterns.append(f"project{i}/output/*")
+        elif kind == 3:
+            patterns.append(f"data{i}_*.bin")
+        else:
+            patterns.append(f"!keep{i}.log")
+    return patterns
+
+def build_paths(count, seed=0):
+    """生成测试路径，包含文件和目录"""
+    rng = random.Random(seed)
+    names = ["src", "docs", "build", "project3", "output", "cache7", "lib", "tests", "node_modules"]
+    exts = ["py", "pyc", "txt", "log", "tmp", "ext10", "bin", "md"]
+    paths = []
+    for i in range(count):
+        depth = rng.randint(0, 4)
+        parts = [rng.choice(names) for _ in range(depth)]
+        if rng.random() < 0.2:
+            paths.append(("/".join(parts + [rng.choice(names)]), True))
+        else:
+            parts.append(f"file{i}.{rng.choice(exts)}")
+            paths.append(("/".join(parts), False))
+    return paths
+
+def legacy_should_ignore(compiled_patterns, path, is_dir):
+    """原来的备用实现：依次匹配每条规则"""
+    path_with_slash = path + '/' if is_dir else path
+    result = False
+    for info in compiled_patterns:
+        if info['compiled'].match(path) or (is_dir and info['is_directory'] and info['compiled'].match(path_with_slash)):
+            result = not info['is_negation']
+    return result
+
+def compile_legacy(patterns):
+    compiled = []
+    for pattern in patterns:
+        is_negation = pattern.startswith('!')
+        if is_negation:
+            pattern = pattern[1:]
+        is_directory = pattern.endswith('/')
+        if is_directory:
+            pattern = pattern[:-1]
+        compiled.append({
+            'compiled': re.compile(fnmatch.translate(pattern)),
+            'is_negation': is_negation,
+            'is_directory': is_directory
+        })
+    return compiled
+
+def measure(name, func, paths, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(path, is_dir) for path, is_dir in paths]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<12} {best * 1000:10.1f} ms  {len(paths) / best:12.0f} 路径/秒")
+    return results
+
+def run(pattern_count=500, path_count=50000):
+    patterns = build_patterns(pattern_count)
+    paths = build_paths(path_count)
+    print(f"\n=== {len(patterns)} 条规则, {len(paths)} 个路径 ===")
+
+    pathspec_available = ignore_module.PATHSPEC_AVAILABLE
+    if pathspec_available:
+        rules = IgnoreRules(patterns=patterns)
+        measure("pathspec", rules.should_ignore, paths)
+    else:
+        print("pathspec     未安装，跳过")
+
+    legacy = compile_legacy(patterns)
+    expected = measure("逐条匹配", lambda path, is_dir: legacy_should_ignore(legacy, path, is_dir), paths)
+
+    # 临时关闭pathspec，测量备用实现
+    ignore_module.PATHSPEC_AVAILABLE = False
+    try:
+        rules = IgnoreRules(patterns=patterns)
+        results = measure("备用实现", rules.should_ignore, paths)
+    finally:
+        ignore_module.PATHSPEC_AVAILABLE = pathspec_available
+
+    if results != expected:
+        mismatches = sum(1 for a, b in zip(results, expected) if a != b)
+        print(f"警告: 备用实现与逐条匹配有 {mismatches} 个结果不一致")
+
+if __name__ == "__main__":
+    for count in (20, 200, 1000):
+        run(pattern_count=count)
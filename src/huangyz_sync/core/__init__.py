@@ -3,6 +3,10 @@
 """
 
 from .file_manager import FileManager
-from .sync import sync_directories, AutoSync
+from .sync import sync_directories, sync_paths, AutoSync
+from .repository import ChunkRepository
+from .scheduler import SyncScheduler
+from .shared import SharedSourceCache
 
-__all__ = ['FileManager', 'sync_directories', 'AutoSync'] 
\ No newline at end of file
+__all__ = ['FileManager', 'sync_directories', 'sync_paths', 'AutoSync', 'ChunkRepository', 'SyncScheduler',
+           'SharedSourceCache'] 
\ No newline at end of file
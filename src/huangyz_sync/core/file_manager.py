@@ -3,13 +3,104 @@
 """
 
 import os
+import mmap
+import errno
 import shutil
 from pathlib import Path
 import datetime
 
-from ..utils.common import format_size, calculate_file_hash
+from ..utils.common import format_size, calculate_file_hash, is_sparse_file, iter_data_extents, ZERO_BLOCK
 from ..utils.ignore import IgnoreRules
 
+# 带I/O提示复制时的读写缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# O_DIRECT要求的偏移和长度对齐单位
+DIRECT_IO_ALIGNMENT = 4096
+
+# posix_fadvise/posix_fallocate 仅在POSIX平台可用，其他平台忽略I/O提示
+IO_HINTS_AVAILABLE = hasattr(os, "posix_fadvise")
+
+def _fadvise(fd, advice):
+    """设置文件访问提示，平台或文件系统不支持时忽略"""
+    if not IO_HINTS_AVAILABLE:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+
+def _preallocate(fd, size):
+    """预分配目标文件空间，减少碎片"""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            pass
+
+def _drop_cache(src_fd, dst_fd):
+    """复制完成后释放源和目标文件的页缓存"""
+    # 目标文件的脏页必须先写回，DONTNEED才能真正释放；macOS等平台没有fdatasync，
+    # 部分文件系统不支持时同样忽略，复制本身已经完成
+    if hasattr(os, "fdatasync"):
+        try:
+            os.fdatasync(dst_fd)
+        except OSError:
+            pass
+    _fadvise(dst_fd, "POSIX_FADV_DONTNEED")
+    _fadvise(src_fd, "POSIX_FADV_DONTNEED")
+
+def _copy_direct(source_path, destination_path, size, io_hints):
+    """
+    使用O_DIRECT绕过页缓存复制文件
+    
+    返回:
+        int: 实际写入的字节数；文件系统不支持O_DIRECT时返回None，由调用方退回普通复制
+    """
+    if not hasattr(os, "O_DIRECT"):
+        return None
+    try:
+        src_fd = os.open(source_path, os.O_RDONLY | os.O_DIRECT)
+    except OSError:
+        return None
+    try:
+        try:
+            dst_fd = os.open(destination_path,
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+        except OSError:
+            return None
+        try:
+            if io_hints.get("preallocate"):
+                _preallocate(dst_fd, size)
+            # mmap分配的缓冲区按页对齐，满足O_DIRECT的对齐要求
+            buffer = mmap.mmap(-1, COPY_BUFFER_SIZE)
+            try:
+                written = 0
+                with memoryview(buffer) as view:
+                    while written < size:
+                        n = os.readv(src_fd, [buffer])
+                        if n <= 0:
+                            break
+                        # 末尾不足一个对齐块时整块写出，最后再截断到实际大小
+                        aligned = (n + DIRECT_IO_ALIGNMENT - 1) // DIRECT_IO_ALIGNMENT * DIRECT_IO_ALIGNMENT
+                        os.writev(dst_fd, [view[:aligned]])
+                        written += n
+                os.ftruncate(dst_fd, written)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                # 打开成功但实际读写不满足对齐要求(如某些网络或FUSE文件系统)，
+                # 丢弃已写入的部分，由调用方以O_TRUNC重新打开目标做普通复制
+                os.ftruncate(dst_fd, 0)
+                return None
+            finally:
+                buffer.close()
+            return written
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
 class FileManager:
     """文件管理器类，提供常见的文件和文件夹操作"""
     
@@ -37,16 +128,111 @@ class FileManager:
             return False
     
     @staticmethod
-    def copy_file(source_path, destination_path):
-        """复制文件"""
+    def copy_file(source_path, destination_path, stats=None, io_hints=None):
+        """
+        复制文件，稀疏文件只复制数据区段并在目标上保留空洞
+
+        参数:
+            source_path: 源文件路径
+            destination_path: 目标文件路径
+            stats: 可选的统计字典，累加 logical_bytes(逻辑大小) 和 physical_bytes(实际写入字节数)
+            io_hints: 可选的I/O提示字典，支持的键:
+                preallocate: 写入前用posix_fallocate预分配目标文件
+                sequential: 读取源文件前设置POSIX_FADV_SEQUENTIAL
+                drop_cache: 复制完成后对源和目标设置POSIX_FADV_DONTNEED，避免挤占页缓存
+                direct_io_threshold: 大于等于该字节数的文件使用O_DIRECT复制，0表示不使用
+        """
         try:
-            shutil.copy2(source_path, destination_path)
+            file_stat = os.stat(source_path)
+            if is_sparse_file(file_stat):
+                written = FileManager._copy_sparse_file(
+                    source_path, destination_path, file_stat.st_size, io_hints)
+                shutil.copystat(source_path, destination_path)
+            elif io_hints and IO_HINTS_AVAILABLE:
+                written = FileManager._copy_with_hints(
+                    source_path, destination_path, file_stat.st_size, io_hints)
+                shutil.copystat(source_path, destination_path)
+            else:
+                shutil.copy2(source_path, destination_path)
+                written = file_stat.st_size
+
+            if stats is not None:
+                stats["logical_bytes"] = stats.get("logical_bytes", 0) + file_stat.st_size
+                stats["physical_bytes"] = stats.get("physical_bytes", 0) + written
             print(f"文件复制成功: {source_path} -> {destination_path}")
             return True
         except Exception as e:
             print(f"复制文件时出错: {e}")
             return False
-    
+
+    @staticmethod
+    def _copy_sparse_file(source_path, destination_path, size, io_hints=None):
+        """按SEEK_DATA/SEEK_HOLE区段复制稀疏文件，返回实际写入的字节数"""
+        io_hints = io_hints or {}
+        block_size = len(ZERO_BLOCK)
+        written = 0
+        src_fd = os.open(source_path, os.O_RDONLY)
+        try:
+            if io_hints.get("sequential"):
+                _fadvise(src_fd, "POSIX_FADV_SEQUENTIAL")
+            # 截断为0再扩展到逻辑大小，目标文件原有的数据块全部释放成空洞
+            dst_fd = os.open(destination_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.ftruncate(dst_fd, size)
+                for start, end in iter_data_extents(src_fd, size):
+                    offset = start
+                    while offset < end:
+                        data = os.pread(src_fd, min(block_size, end - offset), offset)
+                        if not data:
+                            break
+                        # 数据区段中的全零块同样保留为空洞
+                        if memoryview(ZERO_BLOCK)[:len(data)] != data:
+                            os.pwrite(dst_fd, data, offset)
+                            written += len(data)
+                        offset += len(data)
+                if io_hints.get("drop_cache"):
+                    _drop_cache(src_fd, dst_fd)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        return written
+
+    @staticmethod
+    def _copy_with_hints(source_path, destination_path, size, io_hints):
+        """按I/O提示复制普通文件，返回实际写入的字节数"""
+        threshold = io_hints.get("direct_io_threshold", 0)
+        if threshold and size >= threshold:
+            written = _copy_direct(source_path, destination_path, size, io_hints)
+            if written is not None:
+                return written
+
+        written = 0
+        src_fd = os.open(source_path, os.O_RDONLY)
+        try:
+            if io_hints.get("sequential"):
+                _fadvise(src_fd, "POSIX_FADV_SEQUENTIAL")
+            dst_fd = os.open(destination_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if io_hints.get("preallocate"):
+                    _preallocate(dst_fd, size)
+                while True:
+                    data = os.read(src_fd, COPY_BUFFER_SIZE)
+                    if not data:
+                        break
+                    view = memoryview(data)
+                    while view:
+                        n = os.write(dst_fd, view)
+                        view = view[n:]
+                    written += len(data)
+                if io_hints.get("drop_cache"):
+                    _drop_cache(src_fd, dst_fd)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        return written
+
     @staticmethod
     def copy_directory(source_dir, destination_dir):
         """复制整个文件夹"""
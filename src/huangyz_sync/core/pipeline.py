@@ -0,0 +1,411 @@
+"""
+同步流水线模块，将目录同步拆分为 扫描 -> 比较 -> 传输 / 删除 四个阶段
+
+各阶段之间通过有界队列连接，队列满时上游阶段阻塞等待(背压)，
+因此无论目录树多大，排队中的待处理项数量都是固定上限。
+"""
+
+import os
+import threading
+import collections
+
+from .file_manager import FileManager
+from .scanner import scan_tree
+from ..utils.common import calculate_file_hash
+
+class _TargetDirCache:
+    """
+    单次同步中已知存在的目标目录集合，避免对每个目录重复调用exists/makedirs
+
+    扫描线程和传输线程同时使用，集合的读写都在锁内进行，文件系统访问在锁外进行。
+    """
+
+    def __init__(self, target_dir):
+        self.target_dir = target_dir
+        self.known = {target_dir}
+        self.listed = set()
+        self._lock = threading.Lock()
+
+    def listing(self, path):
+        """
+        列出目标目录的内容，同时把它和其中的子目录记为已存在
+
+        返回:
+            dict: 名称 -> 是否为目录；目录不存在时返回None
+        """
+        # 上级目录已列出且其中没有该目录时，无需再访问文件系统
+        with self._lock:
+            if path not in self.known and os.path.dirname(path) in self.listed:
+                return None
+
+        try:
+            with os.scandir(path) as it:
+                entries = {entry.name: entry.is_dir() for entry in it}
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        with self._lock:
+            self.known.add(path)
+            self.listed.add(path)
+            for name, is_dir in entries.items():
+                if is_dir:
+                    self.known.add(os.path.join(path, name))
+        return entries
+
+    def ensure(self, path):
+        """确保目标目录存在，父目录一次创建，返回是否新建了目录"""
+        with self._lock:
+            if path in self.known:
+                return False
+
+        os.makedirs(path, exist_ok=True)
+        print(f"已创建目标子目录: {path}")
+        # 新建目录的所有上级目录也都已存在
+        with self._lock:
+            while path not in self.known:
+                self.known.add(path)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+        return True
+
+class _StageQueue:
+    """
+    阶段之间的有界队列
+
+    提供调度器时按其优先级出队(只在队列内已缓冲的项之间排序)，否则先进先出。
+    close()之后不再接受新项，取空后get()返回None。
+    """
+
+    def __init__(self, maxsize, scheduler=None):
+        self.maxsize = maxsize
+        self._items = scheduler.clone() if scheduler is not None else collections.deque()
+        self._prioritized = scheduler is not None
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                self._cond.wait()
+            if self._prioritized:
+                self._items.push(item)
+            else:
+                self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while not len(self._items) and not self._closed:
+                self._cond.wait()
+            if not len(self._items):
+                return None
+            item = self._items.pop() if self._prioritized else self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class SyncPipeline:
+    """执行一次目录同步的流水线"""
+
+    def __init__(self, source_dir, target_dir, ignore_rules=None, delete_extra=False,
+                 compare_content=True, io_hints=None, scheduler=None, scan_workers=1,
+                 compare_workers=1, transfer_workers=1, queue_size=1000, spill_store=None, subtree=None,
+                 source_cache=None):
+        """
+        初始化同步流水线
+
+        参数:
+            source_dir: 源目录路径
+            target_dir: 目标目录路径
+            ignore_rules: IgnoreRules对象
+            delete_extra: 是否删除目标目录中多余的文件
+            compare_content: 是否通过内容比较决定是否需要复制
+            io_hints: 复制文件时使用的I/O提示，参见FileManager.copy_file
+            scheduler: 可选的SyncScheduler，比较和传输队列按其优先级出队
+            scan_workers: 扫描阶段并发列目录的线程数
+            compare_workers: 比较(哈希)阶段的线程数
+            transfer_workers: 传输阶段的线程数
+            queue_size: 每个阶段队列的容量上限
+            spill_store: 可选的SpillStore；提供时删除阶段改为在扫描完成后，
+                         用源/目标清单在磁盘上归并计算差异，而不是逐个stat源文件
+            subtree: 只同步这个子目录(相对源目录的路径)，忽略规则仍按相对源目录的路径匹配
+            source_cache: 可选的SharedSourceCache，与其他任务共用源目录的列表和文件哈希
+        """
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.ignore_rules = ignore_rules
+        self.delete_extra = delete_extra
+        self.compare_content = compare_content
+        self.io_hints = io_hints
+        self.scheduler = scheduler
+        self.scan_workers = max(1, scan_workers)
+        self.compare_workers = max(1, compare_workers)
+        self.transfer_workers = max(1, transfer_workers)
+        self.queue_size = max(1, queue_size)
+        self.subtree = subtree or '.'
+        self.source_cache = source_cache
+
+        self._dir_cache = _TargetDirCache(target_dir)
+        # 扫描时无法读取的源目录(相对路径)，其中的内容未知，删除阶段不处理对应的目标子树
+        self._scan_errors = []
+        self._stats_lock = threading.Lock()
+        # 源目录清单，只在溢出模式下需要删除多余文件时记录
+        self._source_index = spill_store.create_path_set() if spill_store is not None and delete_extra else None
+
+    def run(self, operations):
+        """
+        执行流水线，把结果记录到operations中
+
+        参数:
+            operations: sync_directories使用的操作记录字典
+        """
+        compare_queue = _StageQueue(self.queue_size, self.scheduler)
+        transfer_queue = _StageQueue(self.queue_size, self.scheduler)
+
+        comparators = [
+            threading.Thread(target=self._compare_stage, args=(compare_queue, transfer_queue, operations), daemon=True)
+            for _ in range(self.compare_workers)
+        ]
+        transferers = [
+            threading.Thread(target=self._transfer_stage, args=(transfer_queue, operations), daemon=True)
+            for _ in range(self.transfer_workers)
+        ]
+        for thread in comparators + transferers:
+            thread.start()
+
+        try:
+            self._scan_stage(compare_queue, transfer_queue, operations)
+        finally:
+            # 扫描结束后关闭比较队列；比较线程全部退出后，传输队列不会再有新项
+            compare_queue.close()
+            for thread in comparators:
+                thread.join()
+            transfer_queue.close()
+            for thread in transferers:
+                thread.join()
+
+        # 无法读取的源目录没有同步，与失败的路径一样需要之后重试
+        for rel_path in self._scan_errors:
+            operations["failed"].append(rel_path)
+
+        # 删除阶段在传输全部完成后执行：与传输并行时，运行期间源目录的变化可能让删除线程
+        # 删掉传输线程正在写入或已记为存在的目标目录；扫描出错时不删除任何文件
+        if self.delete_extra:
+            self._delete_stage(operations)
+
+    def _scan_stage(self, compare_queue, transfer_queue, operations):
+        """扫描阶段：遍历源目录，目标不存在的文件直接送去传输，其余送去比较"""
+        dir_cache = self._dir_cache
+
+        # 被忽略的文件和子目录在扫描时就已剪除
+        for root, rel_path, dirs, files in scan_tree(
+                self.source_dir, self.ignore_rules, workers=self.scan_workers,
+                ignored=operations["ignored"], rel_root=self.subtree,
+                lister=self.source_cache.listing if self.source_cache is not None else None,
+                errors=self._scan_errors):
+            # 计算相对路径，用于在目标目录中创建对应结构
+            target_root = os.path.join(self.target_dir, rel_path) if rel_path != '.' else self.target_dir
+
+            # 一次列出对应的目标目录，代替逐个文件的exists调用
+            target_entries = dir_cache.listing(target_root)
+
+            if self._source_index is not None:
+                for dir_name in dirs:
+                    self._source_index.add(os.path.join(rel_path, dir_name) if rel_path != '.' else dir_name)
+
+            # 处理文件（被忽略的文件已在扫描时过滤）
+            for entry in files:
+                file_name = entry.name
+                file_rel_path = os.path.join(rel_path, file_name) if rel_path != '.' else file_name
+
+                if self._source_index is not None:
+                    self._source_index.add(file_rel_path)
+
+                item = {
+                    "source": os.path.join(root, file_name),
+                    "target": os.path.join(target_root, file_name),
+                    "rel_path": file_rel_path
+                }
+                # 目标文件不存在时直接复制，否则需要比较后决定是否更新
+                if target_entries is not None and file_name in target_entries:
+                    item["action"] = "update"
+                    compare_queue.put(item)
+                else:
+                    item["action"] = "copy"
+                    transfer_queue.put(item)
+
+            # 叶子目录在目标中也要存在（空目录同样保持镜像），中间目录由其子目录一并创建
+            if not dirs:
+                dir_cache.ensure(target_root)
+
+    def _compare_stage(self, compare_queue, transfer_queue, operations):
+        """比较阶段：比较源文件和目标文件，需要更新的送去传输"""
+        while True:
+            item = compare_queue.get()
+            if item is None:
+                return
+
+            source_file = item["source"]
+            target_file = item["target"]
+            try:
+                # 检查文件是否需要更新
+                need_update = False
+                if self.compare_content:
+                    # 通过哈希值比较文件内容
+                    if self.source_cache is not None:
+                        source_hash = self.source_cache.file_hash(source_file)
+                    else:
+                        source_hash = calculate_file_hash(source_file)
+                    target_hash = calculate_file_hash(target_file)
+                    need_update = source_hash != target_hash
+                else:
+                    # 通过修改时间比较
+                    source_mtime = os.path.getmtime(source_file)
+                    target_mtime = os.path.getmtime(target_file)
+                    need_update = source_mtime > target_mtime
+            except OSError as e:
+                print(f"比较文件时出错: {e}")
+                operations["failed"].append(item["rel_path"])
+                continue
+
+            if need_update:
+                transfer_queue.put(item)
+            else:
+                operations["skipped"].append(target_file)
+
+    def _transfer_stage(self, transfer_queue, operations):
+        """传输阶段：复制新文件和需要更新的文件"""
+        stats = {"logical_bytes": 0, "physical_bytes": 0}
+        try:
+            while True:
+                item = transfer_queue.get()
+                if item is None:
+                    return
+
+                target_file = item["target"]
+                try:
+                    self._dir_cache.ensure(os.path.dirname(target_file))
+                except OSError as e:
+                    print(f"创建目标子目录时出错: {e}")
+                    operations["failed"].append(item["rel_path"])
+                    continue
+                if FileManager.copy_file(item["source"], target_file, stats=stats, io_hints=self.io_hints):
+                    operations["copied" if item["action"] == "copy" else "updated"].append(target_file)
+                else:
+                    operations["failed"].append(item["rel_path"])
+        finally:
+            # 每个传输线程单独累计字节数，结束时合并，避免逐文件加锁
+            with self._stats_lock:
+                for key, value in stats.items():
+                    operations["stats"][key] = operations["stats"].get(key, 0) + value
+
+    def _delete_stage(self, operations):
+        """删除阶段：删除目标目录中源目录已不存在的文件和目录"""
+        try:
+            if self._source_index is not None:
+                self._delete_by_diff(operations)
+            else:
+                self._delete_extra_entries(operations)
+        except Exception as e:
+            print(f"删除多余文件时出错: {e}")
+
+    def _delete_extra_entries(self, operations):
+        source_dir = self.source_dir
+        target_dir = self.target_dir
+
+        for root, dirs, files in self._walk_target():
+            # 计算相对路径，用于在源目录中查找对应文件
+            rel_path = os.path.relpath(root, target_dir)
+            source_root = os.path.join(source_dir, rel_path) if rel_path != '.' else source_dir
+
+            # 处理文件
+            for file_name in files:
+                target_file = os.path.join(root, file_name)
+                source_file = os.path.join(source_root, file_name)
+
+                # 如果源文件不存在，删除目标文件
+                if not os.path.exists(source_file):
+                    if FileManager.delete_file(target_file):
+                        operations["deleted"].append(target_file)
+                    else:
+                        operations["failed"].append(os.path.relpath(target_file, target_dir))
+
+            # 处理多余的目录（从后向前遍历，确保先处理子目录）
+            i = len(dirs) - 1
+            while i >= 0:
+                dir_name = dirs[i]
+                target_dir_path = os.path.join(root, dir_name)
+                source_dir_path = os.path.join(source_root, dir_name)
+
+                if not os.path.exists(source_dir_path):
+                    if FileManager.delete_directory(target_dir_path, force=True):
+                        operations["deleted"].append(target_dir_path)
+                        # 防止os.walk继续处理已删除的目录
+                        dirs.pop(i)
+                    else:
+                        operations["failed"].append(os.path.relpath(target_dir_path, target_dir))
+
+                i -= 1
+
+    def _walk_target(self):
+        """
+        遍历目标目录，与os.walk相同地产生 (目录路径, 子目录名列表, 文件名列表)
+
+        每个目录的条目通过filter_entries一次过滤，被忽略的文件不会产生，被忽略的子目录不会进入；
+        扫描时无法读取的源目录对应的目标子树也不会进入
+        """
+        ignore_rules = self.ignore_rules
+        walk_root = os.path.join(self.target_dir, self.subtree) if self.subtree != '.' else self.target_dir
+        for root, dirs, files in os.walk(walk_root):
+            rel_path = os.path.relpath(root, self.target_dir)
+            if self._unscanned(rel_path):
+                dirs[:] = []
+                continue
+            if ignore_rules:
+                entries = [(name, True) for name in dirs] + [(name, False) for name in files]
+                entries = ignore_rules.filter_entries(rel_path, entries)
+                dirs[:] = [name for name, is_dir in entries if is_dir]
+                files = [name for name, is_dir in entries if not is_dir]
+            yield root, dirs, files
+
+    def _unscanned(self, rel_path):
+        """相对路径是否位于扫描时无法读取的源目录中"""
+        for error_path in self._scan_errors:
+            if error_path == '.' or rel_path == error_path or rel_path.startswith(error_path + os.sep):
+                return True
+        return False
+
+    def _iter_target_entries(self):
+        """遍历目标目录，产生未被忽略的 (相对路径, 是否目录)"""
+        for root, dirs, files in self._walk_target():
+            rel_path = os.path.relpath(root, self.target_dir)
+            for name in dirs:
+                yield (os.path.join(rel_path, name) if rel_path != '.' else name), True
+            for name in files:
+                yield (os.path.join(rel_path, name) if rel_path != '.' else name), False
+
+    def _delete_by_diff(self, operations):
+        """按源/目标清单的差异删除多余的文件和目录"""
+        deleted_dir = None
+        for rel_path, is_dir in self._source_index.missing(self._iter_target_entries()):
+            # 差异按路径排序，已删除目录的子孙紧跟在它之后，直接跳过
+            if deleted_dir is not None and rel_path.startswith(deleted_dir + os.sep):
+                continue
+
+            target_path = os.path.join(self.target_dir, rel_path)
+            if is_dir:
+                if FileManager.delete_directory(target_path, force=True):
+                    operations["deleted"].append(target_path)
+                else:
+                    operations["failed"].append(rel_path)
+                deleted_dir = rel_path
+            elif FileManager.delete_file(target_path):
+                operations["deleted"].append(target_path)
+            else:
+                operations["failed"].append(rel_path)
@@ -0,0 +1,508 @@
+"""
+去重仓库模块，提供基于内容定义分块(CDC)的备份目标后端
+"""
+
+import os
+import json
+import time
+import zlib
+import lzma
+import hashlib
+import datetime
+
+from ..utils.ignore import IgnoreRules
+
+# numpy可选：有numpy时按块向量化计算Gear哈希，否则逐字节计算(纯Python约几MB/秒)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Gear哈希表：由固定种子生成，保证不同运行之间的分块边界一致
+GEAR_TABLE = [
+    int.from_bytes(hashlib.sha256(b"huangyz_sync_gear_" + bytes([i])).digest()[:8], "little")
+    for i in range(256)
+]
+
+_MASK_64 = (1 << 64) - 1
+
+if NUMPY_AVAILABLE:
+    _GEAR_ARRAY = np.array(GEAR_TABLE, dtype=np.uint64)
+
+# 向量化查找切分点时每次计算的字节数
+SCAN_BLOCK_SIZE = 256 * 1024
+
+def _make_mask(bits):
+    """生成在64位范围内分散分布的判定掩码"""
+    mask = 0
+    step = max(64 // max(bits, 1), 1)
+    for i in range(bits):
+        mask |= 1 << (63 - i * step)
+    return mask
+
+class ChunkRepository:
+    """
+    基于FastCDC分块的去重仓库
+
+    仓库目录结构:
+        config.json         分块参数和压缩方式
+        index/*.json        块索引段，每次备份追加一段新块的 块ID -> [包文件, 偏移, 长度]
+        index.json          旧版本的完整块索引(只读取，不再写入)
+        packs/*.pack        压缩后的块数据
+        snapshots/*.json    每个快照的 文件 -> 块列表 索引
+    """
+
+    CONFIG_FILE = "config.json"
+    INDEX_FILE = "index.json"
+    INDEX_DIR = "index"
+    PACK_DIR = "packs"
+    SNAPSHOT_DIR = "snapshots"
+
+    def __init__(self, repo_dir, compression="zlib", min_size=256 * 1024,
+                 avg_size=1024 * 1024, max_size=4 * 1024 * 1024, pack_size=16 * 1024 * 1024):
+        """
+        初始化去重仓库，仓库不存在时自动创建
+
+        参数:
+            repo_dir: 仓库目录
+            compression: 块压缩方式，可选 'zlib'、'lzma' 或 'none'
+            min_size: 最小块大小(字节)
+            avg_size: 期望平均块大小(字节)
+            max_size: 最大块大小(字节)
+            pack_size: 单个包文件的大小上限(字节)
+        """
+        if compression not in ("zlib", "lzma", "none"):
+            raise ValueError(f"不支持的压缩方式: {compression}")
+
+        self.repo_dir = os.path.abspath(repo_dir)
+        self.compression = compression
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.pack_size = pack_size
+        self.index = {}
+        # 本次运行新写入、尚未保存到索引段的块
+        self._new_index = {}
+        self._pack_file = None
+        self._pack_name = None
+
+        self._init_repo()
+
+    def _init_repo(self):
+        """创建仓库目录结构并加载配置和块索引"""
+        os.makedirs(os.path.join(self.repo_dir, self.PACK_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.repo_dir, self.SNAPSHOT_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.repo_dir, self.INDEX_DIR), exist_ok=True)
+
+        config_path = os.path.join(self.repo_dir, self.CONFIG_FILE)
+        if os.path.exists(config_path):
+            # 已有仓库的分块参数必须保持不变，否则无法去重
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self.min_size = config["min_size"]
+            self.avg_size = config["avg_size"]
+            self.max_size = config["max_size"]
+        else:
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": 1,
+                    "chunker": "fastcdc-gear",
+                    "min_size": self.min_size,
+                    "avg_size": self.avg_size,
+                    "max_size": self.max_size
+                }, f, indent=2)
+            print(f"已创建去重仓库: {self.repo_dir}")
+
+        index_path = os.path.join(self.repo_dir, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        for name in self._index_segments():
+            with open(os.path.join(self.repo_dir, self.INDEX_DIR, name), 'r', encoding='utf-8') as f:
+                self.index.update(json.load(f))
+
+        # 归一化分块：平均大小之前使用更严格的掩码，之后使用更宽松的掩码
+        bits = max(self.avg_size.bit_length() - 1, 1)
+        self._mask_s = _make_mask(bits + 2)
+        self._mask_l = _make_mask(max(bits - 2, 1))
+
+    def chunk_file(self, file_path):
+        """
+        按内容定义分块切分文件
+
+        安装了numpy时切分点按块向量化查找；否则逐字节计算，
+        纯Python的速度只有几MB/秒，多GB的文件建议安装numpy。两种方式得到的切分点相同。
+
+        返回:
+            生成器，逐个产生块数据(bytes)
+        """
+        min_size = self.min_size
+        max_size = self.max_size
+        find_cut = self._find_cut_vectorized if NUMPY_AVAILABLE else self._find_cut
+
+        with open(file_path, "rb") as f:
+            buffer = b""
+            eof = False
+            while True:
+                if not eof and len(buffer) < max_size:
+                    data = f.read(max_size * 2)
+                    if data:
+                        buffer += data
+                    else:
+                        eof = True
+                if not buffer:
+                    break
+
+                length = len(buffer)
+                if length <= min_size:
+                    if eof:
+                        yield buffer
+                        break
+                    continue
+
+                # 在 [min_size, max_size) 范围内查找切分点
+                limit = min(length, max_size)
+                cut = find_cut(buffer, limit)
+
+                if cut == limit and limit == length and not eof:
+                    # 数据不足以确定边界，继续读取
+                    continue
+
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+
+    def _find_cut(self, buffer, limit):
+        """逐字节计算Gear哈希，返回切分位置，没有找到时返回limit"""
+        mask_s = self._mask_s
+        mask_l = self._mask_l
+        gear = GEAR_TABLE
+        normal = min(self.avg_size, limit)
+        h = 0
+        i = self.min_size
+        while i < normal:
+            h = ((h << 1) + gear[buffer[i]]) & _MASK_64
+            if not h & mask_s:
+                return i + 1
+            i += 1
+        while i < limit:
+            h = ((h << 1) + gear[buffer[i]]) & _MASK_64
+            if not h & mask_l:
+                return i + 1
+            i += 1
+        return limit
+
+    def _find_cut_vectorized(self, buffer, limit):
+        """
+        与_find_cut结果相同的向量化实现
+
+        Gear哈希左移64次后旧字节的贡献全部移出，位置i的哈希只取决于前64个字节：
+        h[i] = sum(gear[b[i-k]] << k), k < 64 且 i-k >= min_size。
+        按块计算时每块向前多取63个字节作为上下文，用倍增法求出整块的哈希后只检查满足掩码的位置。
+        """
+        start = self.min_size
+        normal = min(self.avg_size, limit)
+        for segment_end, mask in ((normal, self._mask_s), (limit, self._mask_l)):
+            mask = np.uint64(mask)
+            while start < segment_end:
+                end = min(start + SCAN_BLOCK_SIZE, segment_end)
+                context = max(self.min_size, start - 63)
+                data = np.frombuffer(buffer, dtype=np.uint8, count=end - context, offset=context)
+                h = _GEAR_ARRAY[data]
+                width = 1
+                while width < 64:
+                    shifted = np.zeros_like(h)
+                    shifted[width:] = h[:-width] << np.uint64(width)
+                    h += shifted
+                    width *= 2
+                hits = np.flatnonzero((h[start - context:] & mask) == 0)
+                if hits.size:
+                    return start + int(hits[0]) + 1
+                start = end
+        return limit
+
+    def _compress(self, data):
+        if self.compression == "zlib":
+            return b"Z" + zlib.compress(data, 6)
+        if self.compression == "lzma":
+            return b"X" + lzma.compress(data)
+        return b"N" + data
+
+    @staticmethod
+    def _decompress(data):
+        kind, payload = data[:1], data[1:]
+        if kind == b"Z":
+            return zlib.decompress(payload)
+        if kind == b"X":
+            return lzma.decompress(payload)
+        return payload
+
+    def _open_pack(self):
+        """打开当前可追加的包文件，超过大小上限时新建包文件"""
+        if self._pack_file and self._pack_file.tell() < self.pack_size:
+            return self._pack_file
+
+        self._close_pack()
+        pack_dir = os.path.join(self.repo_dir, self.PACK_DIR)
+        existing = sorted(name for name in os.listdir(pack_dir) if name.endswith(".pack"))
+        if existing and os.path.getsize(os.path.join(pack_dir, existing[-1])) < self.pack_size:
+            name = existing[-1]
+        else:
+            name = f"{len(existing):08d}.pack"
+        self._pack_name = name
+        self._pack_file = open(os.path.join(pack_dir, name), "ab")
+        return self._pack_file
+
+    def _close_pack(self):
+        if self._pack_file:
+            self._pack_file.flush()
+            os.fsync(self._pack_file.fileno())
+            self._pack_file.close()
+            self._pack_file = None
+            self._pack_name = None
+
+    def store_chunk(self, data):
+        """
+        保存一个块，已存在的块只返回其ID
+
+        返回:
+            tuple: (块ID, 是否为新写入的块)
+        """
+        chunk_id = hashlib.sha256(data).hexdigest()
+        if chunk_id in self.index:
+            return chunk_id, False
+
+        payload = self._compress(data)
+        pack = self._open_pack()
+        offset = pack.tell()
+        pack.write(payload)
+        self.index[chunk_id] = [self._pack_name, offset, len(payload)]
+        self._new_index[chunk_id] = self.index[chunk_id]
+        return chunk_id, True
+
+    def load_chunk(self, chunk_id):
+        """读取并校验一个块"""
+        pack_name, offset, length = self.index[chunk_id]
+        with open(os.path.join(self.repo_dir, self.PACK_DIR, pack_name), "rb") as f:
+            f.seek(offset)
+            data = self._decompress(f.read(length))
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise IOError(f"块校验失败: {chunk_id}")
+        return data
+
+    def _index_segments(self):
+        index_dir = os.path.join(self.repo_dir, self.INDEX_DIR)
+        return sorted(name for name in os.listdir(index_dir) if name.endswith(".json"))
+
+    def _save_index(self):
+        """把本次新写入的块追加为一个新的索引段，已有的索引不再重写"""
+        if not self._new_index:
+            return
+        segments = self._index_segments()
+        next_number = int(segments[-1][:-5]) + 1 if segments else 0
+        index_path = os.path.join(self.repo_dir, self.INDEX_DIR, f"{next_number:08d}.json")
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._new_index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        self._new_index = {}
+
+    def list_snapshots(self):
+        """列出仓库中的所有快照ID(按时间排序)"""
+        snapshot_dir = os.path.join(self.repo_dir, self.SNAPSHOT_DIR)
+        return sorted(name[:-5] for name in os.listdir(snapshot_dir) if name.endswith(".json"))
+
+    def load_snapshot(self, snapshot_id=None):
+        """加载指定快照，未指定时加载最新快照，不存在时返回None"""
+        if snapshot_id is None:
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                return None
+            snapshot_id = snapshots[-1]
+        path = os.path.join(self.repo_dir, self.SNAPSHOT_DIR, f"{snapshot_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def backup(self, source_dir, ignore_rules=None):
+        """
+        将源目录备份为一个新快照
+
+        参数:
+            source_dir: 源目录路径
+            ignore_rules: IgnoreRules对象或忽略规则文件路径
+
+        返回:
+            dict: 操作记录，与sync_directories的返回格式一致，并附带快照ID和统计信息
+        """
+        try:
+            source_dir = os.path.abspath(source_dir)
+            if ignore_rules and not isinstance(ignore_rules, IgnoreRules):
+                if isinstance(ignore_rules, str) and os.path.exists(ignore_rules):
+                    ignore_rules = IgnoreRules(ignore_file=ignore_rules)
+                else:
+                    ignore_rules = IgnoreRules(patterns=ignore_rules if isinstance(ignore_rules, list) else [])
+
+            operations = {
+                "copied": [],
+                "updated": [],
+                "deleted": [],
+                "skipped": [],
+                "ignored": [],
+                "failed": []
+            }
+            stats = {"chunks": 0, "new_chunks": 0, "bytes": 0, "stored_bytes": 0}
+
+            previous = self.load_snapshot() or {"files": {}}
+            previous_files = previous.get("files", {})
+            files_index = {}
+            dirs_index = []
+
+            for root, dirs, files in os.walk(source_dir):
+                rel_path = os.path.relpath(root, source_dir)
+
+                if ignore_rules:
+                    i = 0
+                    while i < len(dirs):
+                        dir_path = os.path.join(rel_path, dirs[i]) if rel_path != '.' else dirs[i]
+                        if ignore_rules.should_ignore(dir_path, True):
+                            operations["ignored"].append(os.path.join(root, dirs[i]))
+                            dirs.pop(i)
+                        else:
+                            i += 1
+
+                if rel_path != '.':
+                    dirs_index.append(rel_path.replace('\\', '/'))
+
+                for file_name in files:
+                    file_rel_path = os.path.join(rel_path, file_name) if rel_path != '.' else file_name
+                    if ignore_rules and ignore_rules.should_ignore(file_rel_path, False):
+                        operations["ignored"].append(os.path.join(root, file_name))
+                        continue
+
+                    source_file = os.path.join(root, file_name)
+                    key = file_rel_path.replace('\\', '/')
+                    old = previous_files.get(key)
+                    try:
+                        st = os.stat(source_file)
+
+                        # 大小和修改时间未变化时直接复用上一快照的块列表
+                        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns \
+                                and all(c in self.index for c in old["chunks"]):
+                            files_index[key] = old
+                            operations["skipped"].append(source_file)
+                            continue
+
+                        chunks = []
+                        for data in self.chunk_file(source_file):
+                            chunk_id, is_new = self.store_chunk(data)
+                            chunks.append(chunk_id)
+                            stats["chunks"] += 1
+                            stats["bytes"] += len(data)
+                            if is_new:
+                                stats["new_chunks"] += 1
+                                stats["stored_bytes"] += self.index[chunk_id][2]
+                    except OSError as e:
+                        # 遍历期间消失或无法读取的文件不影响其他文件，有上一快照的版本时保留它
+                        print(f"备份文件时出错，已跳过: {e}")
+                        operations["failed"].append(source_file)
+                        if old and all(c in self.index for c in old["chunks"]):
+                            files_index[key] = old
+                        continue
+
+                    files_index[key] = {
+                        "size": st.st_size,
+                        "mtime": st.st_mtime,
+                        "mtime_ns": st.st_mtime_ns,
+                        "chunks": chunks
+                    }
+                    operations["updated" if old else "copied"].append(source_file)
+
+            for key in previous_files:
+                if key not in files_index:
+                    operations["deleted"].append(key)
+
+            # 先落盘包文件，再写块索引和快照，保证快照引用的块都已存在
+            self._close_pack()
+            self._save_index()
+
+            snapshot_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            snapshot = {
+                "id": snapshot_id,
+                "time": time.time(),
+                "source_dir": source_dir,
+                "dirs": dirs_index,
+                "files": files_index
+            }
+            snapshot_path = os.path.join(self.repo_dir, self.SNAPSHOT_DIR, f"{snapshot_id}.json")
+            with open(snapshot_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+
+            operations["snapshot"] = snapshot_id
+            operations["stats"] = stats
+
+            print(f"备份完成! 源目录: {source_dir} -> 仓库: {self.repo_dir}")
+            print(f"快照: {snapshot_id}")
+            print(f"新增 {len(operations['copied'])} 个文件，更新 {len(operations['updated'])} 个文件，"
+                  f"未变化 {len(operations['skipped'])} 个文件，移除 {len(operations['deleted'])} 个文件")
+            if operations["failed"]:
+                print(f"有 {len(operations['failed'])} 个文件无法读取，未备份新版本")
+            print(f"处理了 {stats['chunks']} 个块，其中 {stats['new_chunks']} 个新块，"
+                  f"写入 {stats['stored_bytes']} 字节(原始 {stats['bytes']} 字节)")
+            return operations
+        except Exception as e:
+            self._close_pack()
+            print(f"备份到去重仓库时出错: {e}")
+            return None
+
+    def restore(self, target_dir, snapshot_id=None, paths=None):
+        """
+        从快照恢复文件
+
+        参数:
+            target_dir: 恢复到的目录
+            snapshot_id: 快照ID，未指定时使用最新快照
+            paths: 只恢复这些相对路径(文件或目录前缀)，为None时恢复全部
+
+        返回:
+            list: 恢复的文件路径列表，出错时返回None
+        """
+        try:
+            snapshot = self.load_snapshot(snapshot_id)
+            if snapshot is None:
+                print(f"错误: 未找到快照: {snapshot_id or '最新'}")
+                return None
+
+            prefixes = [p.replace('\\', '/').strip('/') for p in paths] if paths else None
+
+            def selected(rel):
+                if prefixes is None:
+                    return True
+                return any(rel == p or rel.startswith(p + '/') for p in prefixes)
+
+            target_dir = os.path.abspath(target_dir)
+            os.makedirs(target_dir, exist_ok=True)
+            for rel in snapshot.get("dirs", []):
+                if selected(rel):
+                    os.makedirs(os.path.join(target_dir, rel), exist_ok=True)
+
+            restored = []
+            for rel, info in snapshot["files"].items():
+                if not selected(rel):
+                    continue
+                target_file = os.path.join(target_dir, rel)
+                os.makedirs(os.path.dirname(target_file), exist_ok=True)
+                with open(target_file, "wb") as f:
+                    for chunk_id in info["chunks"]:
+                        f.write(self.load_chunk(chunk_id))
+                os.utime(target_file, ns=(info["mtime_ns"], info["mtime_ns"]))
+                restored.append(target_file)
+
+            print(f"恢复完成! 快照: {snapshot['id']} -> {target_dir}，共 {len(restored)} 个文件")
+            return restored
+        except Exception as e:
+            print(f"从去重仓库恢复时出错: {e}")
+            return None
@@ -0,0 +1,146 @@
+"""
+目录扫描模块，提供支持忽略规则剪枝的顺序/并行目录遍历
+"""
+
+import os
+import queue
+import threading
+
+# 并行扫描结束标记
+_SCAN_DONE = object()
+
+def _list_directory(path, rel_path, ignore_rules, ignored, lister=None):
+    """
+    列出一个目录，过滤掉被忽略的文件和子目录
+
+    返回:
+        tuple: (目录路径, 相对路径, 子目录名列表, 文件DirEntry列表, 需要继续遍历的子目录列表)
+    """
+    if lister is not None:
+        entries = lister(path)
+    else:
+        with os.scandir(path) as it:
+            entries = list(it)
+    if ignore_rules:
+        # 整个目录一次过滤，子树入队之前就按忽略规则剪枝
+        dropped = [] if ignored is not None else None
+        entries = ignore_rules.filter_entries(rel_path, entries, dropped)
+        if dropped:
+            for entry in dropped:
+                ignored.append(entry.path)
+
+    dirs = []
+    files = []
+    descend = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            files.append(entry)
+            continue
+
+        dirs.append(entry.name)
+        # 与os.walk一致，不进入指向目录的符号链接
+        if not entry.is_symlink():
+            child_rel = os.path.join(rel_path, entry.name) if rel_path != '.' else entry.name
+            descend.append((entry.path, child_rel))
+    return path, rel_path, dirs, files, descend
+
+def scan_tree(source_dir, ignore_rules=None, workers=1, ignored=None, rel_root='.', lister=None, errors=None):
+    """
+    遍历目录树，按目录产生扫描结果
+
+    参数:
+        source_dir: 要遍历的根目录
+        ignore_rules: 可选的IgnoreRules对象，被忽略的文件不会产生，被忽略的子目录不会进入队列
+        workers: 并发列目录的线程数，1表示在当前线程中顺序遍历
+        ignored: 可选列表，用于收集被忽略的文件和目录路径
+        rel_root: 只遍历这个子目录(相对source_dir的路径)，产生的相对路径仍相对于source_dir
+        lister: 可选的函数 lister(路径) -> DirEntry列表，代替os.scandir(如SharedSourceCache.listing)
+        errors: 可选列表，用于收集无法读取的目录的相对路径
+
+    返回:
+        生成器，逐个产生 (目录路径, 相对路径, 子目录名列表, 文件DirEntry列表)；
+        父目录总是先于其子目录产生，无法读取的目录会被跳过(记录在errors中)
+    """
+    start = (os.path.join(source_dir, rel_root) if rel_root != '.' else source_dir, rel_root)
+    if workers <= 1:
+        yield from _scan_sequential(start, ignore_rules, ignored, lister, errors)
+    else:
+        yield from _scan_parallel(start, ignore_rules, workers, ignored, lister, errors)
+
+def _scan_sequential(start, ignore_rules, ignored, lister, errors):
+    """在当前线程中按深度优先顺序遍历"""
+    stack = [start]
+    while stack:
+        path, rel_path = stack.pop()
+        try:
+            path, rel_path, dirs, files, descend = _list_directory(path, rel_path, ignore_rules, ignored, lister)
+        except OSError as e:
+            print(f"无法读取目录，已跳过: {e}")
+            if errors is not None:
+                errors.append(rel_path)
+            continue
+        yield path, rel_path, dirs, files
+        stack.extend(reversed(descend))
+
+def _scan_parallel(start, ignore_rules, workers, ignored, lister, errors):
+    """多个线程从共享的工作队列中取目录并发列出，适合高延迟的网络文件系统"""
+    work = queue.Queue()
+    results = queue.Queue()
+    lock = threading.Lock()
+    state = {"pending": 1, "stopped": False}
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            path, rel_path = item
+            descend = []
+            try:
+                if not state["stopped"]:
+                    path, rel_path, dirs, files, descend = _list_directory(
+                        path, rel_path, ignore_rules, ignored, lister)
+                    # 先输出本目录的结果再把子目录入队，保证父目录先于子目录产生
+                    results.put((path, rel_path, dirs, files))
+            except OSError as e:
+                print(f"无法读取目录，已跳过: {e}")
+                if errors is not None:
+                    errors.append(rel_path)
+                descend = []
+            except Exception as e:
+                # 其他异常(如忽略规则出错)交给消费方在主线程中重新抛出
+                state["stopped"] = True
+                descend = []
+                results.put(e)
+            finally:
+                # 无论成功与否都要计数，否则消费方永远等不到结束标记
+                with lock:
+                    state["pending"] += len(descend)
+                    for child in descend:
+                        work.put(child)
+                    state["pending"] -= 1
+                    if state["pending"] == 0:
+                        results.put(_SCAN_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    work.put(start)
+
+    try:
+        while True:
+            result = results.get()
+            if result is _SCAN_DONE:
+                break
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        # 消费方提前结束时，剩余的目录不再列出
+        state["stopped"] = True
+        for _ in threads:
+            work.put(None)
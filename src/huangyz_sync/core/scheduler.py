@@ -0,0 +1,119 @@
+"""
+同步调度模块，按优先级策略排列待执行的同步操作
+"""
+
+import os
+import re
+import heapq
+import fnmatch
+import itertools
+
+class SyncScheduler:
+    """
+    位于规划和复制之间的优先级队列
+
+    排序依据依次为:
+        1. 路径优先级规则：匹配靠前规则的文件先执行，未匹配的排在所有规则之后
+        2. 调度策略：fifo(遍历顺序)、newest(修改时间最新优先)、smallest(文件最小优先)
+        3. 加入队列的先后顺序
+
+    任务配置中创建的调度器作为模板在多次同步之间共用，每次同步应通过clone()取得独立的队列，
+    避免某次同步中途出错时残留的操作混入下一次同步。
+    """
+
+    POLICIES = ("fifo", "newest", "smallest")
+
+    def __init__(self, policy="fifo", priority_patterns=None):
+        """
+        初始化调度器
+
+        参数:
+            policy: 调度策略，'fifo'、'newest' 或 'smallest'
+            priority_patterns: 路径优先级规则列表(glob，相对源目录)，越靠前优先级越高
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"不支持的调度策略: {policy}")
+
+        self.policy = policy
+        self.priority_patterns = list(priority_patterns or [])
+        self._compiled = [re.compile(fnmatch.translate(p.replace('\\', '/'))) for p in self.priority_patterns]
+        self._heap = []
+        self._counter = itertools.count()
+
+    @classmethod
+    def from_config(cls, schedule_config):
+        """
+        根据任务配置中的 schedule 选项创建调度器
+
+        参数:
+            schedule_config: 形如 {"policy": "newest", "priority": ["docs/**", "*.db"]} 的字典
+
+        返回:
+            SyncScheduler: 未配置时返回None
+        """
+        if not schedule_config:
+            return None
+        return cls(
+            policy=schedule_config.get("policy", "fifo"),
+            priority_patterns=schedule_config.get("priority")
+        )
+
+    def clone(self):
+        """创建一个策略相同的空调度器，用于多个独立的队列"""
+        return SyncScheduler(self.policy, self.priority_patterns)
+
+    def _priority_rank(self, rel_path):
+        """返回第一条匹配的优先级规则序号，未匹配时排在所有规则之后"""
+        rel_path = rel_path.replace('\\', '/')
+        for rank, compiled in enumerate(self._compiled):
+            if compiled.match(rel_path):
+                return rank
+        return len(self._compiled)
+
+    def _policy_key(self, item):
+        """按调度策略计算排序键，缺少的文件信息在这里补充stat"""
+        if self.policy == "fifo":
+            return 0
+        if "size" not in item or "mtime" not in item:
+            try:
+                file_stat = os.stat(item["source"])
+                item["size"] = file_stat.st_size
+                item["mtime"] = file_stat.st_mtime
+            except OSError:
+                item["size"] = 0
+                item["mtime"] = 0
+        if self.policy == "newest":
+            return -item["mtime"]
+        return item["size"]
+
+    def push(self, item):
+        """
+        加入一个待执行的操作
+
+        参数:
+            item: 操作字典，至少包含 source(源文件路径) 和 rel_path(相对路径)，
+                  可选包含 size 和 mtime 以免重复stat
+        """
+        key = (self._priority_rank(item["rel_path"]), self._policy_key(item), next(self._counter))
+        heapq.heappush(self._heap, (key, item))
+
+    def pop(self):
+        """取出优先级最高的操作，队列为空时返回None"""
+        if not self._heap:
+            return None
+        return heapq.heappop(self._heap)[1]
+
+    def drain(self):
+        """按优先级依次取出所有操作，消费方中途出错或停止时清空剩余的操作"""
+        try:
+            while self._heap:
+                yield heapq.heappop(self._heap)[1]
+        finally:
+            self.clear()
+
+    def clear(self):
+        """丢弃队列中所有未执行的操作"""
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,185 @@
+"""
+跨任务共享的源目录扫描和哈希结果
+
+多个任务的源目录相同或相互包含时，同一个目录只列出一次，同一个文件只计算一次哈希；
+每个任务仍按自己的忽略规则过滤共享的目录列表，得到各自的视图。
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from ..utils.common import calculate_file_hash
+
+# 缓存的目录条目总数上限，超过时淘汰最早缓存的目录列表
+MAX_CACHED_ENTRIES = 200000
+
+class SharedSourceCache:
+    """
+    一次运行中多个任务共用的目录列表和源文件哈希缓存
+
+    目录列表按绝对路径缓存os.DirEntry列表(其stat结果也随之共享)，使用前以目录的修改时间校验，
+    目录在任务之间有增删时重新列出；所有需要它的任务都取过之后即释放，缓存的条目总数另有上限，
+    不会因为目录树很大而占满内存。
+    哈希按路径缓存，并以文件的大小和修改时间校验，文件在任务之间变化时重新计算。
+    """
+
+    def __init__(self, source_dirs=(), max_entries=MAX_CACHED_ENTRIES):
+        """
+        参数:
+            source_dirs: 共用缓存的各任务的源目录(每个任务一项)，用于计算每个目录会被取用几次；
+                         为空时目录列表只按条目总数上限淘汰
+            max_entries: 缓存的目录条目总数上限
+        """
+        self._lock = threading.Lock()
+        self._sources = [self._key(path) for path in source_dirs]
+        self.max_entries = max_entries
+        # 绝对路径 -> [DirEntry列表, 目录修改时间(纳秒), 列出耗时, 剩余取用次数(None表示未知)]
+        self._listings = OrderedDict()
+        self._entry_count = 0
+        # 绝对路径 -> (大小, 修改时间(纳秒), 哈希值, 计算耗时)
+        self._hashes = {}
+        # 正在计算哈希的路径 -> Event，其他任务等待结果而不是重复计算
+        self._hashing = {}
+        self._stats = {"listing_hits": 0, "listing_misses": 0, "hash_hits": 0, "hash_misses": 0,
+                       "saved_seconds": 0.0}
+
+    @staticmethod
+    def _key(path):
+        return os.path.normpath(os.path.abspath(path))
+
+    def _consumers(self, key):
+        """源目录包含该目录的任务数，即目录列表会被取用的次数"""
+        if not self._sources:
+            return None
+        return sum(1 for source in self._sources
+                   if key == source or key.startswith(os.path.join(source, '')))
+
+    def _drop(self, key):
+        cached = self._listings.pop(key, None)
+        if cached is not None:
+            self._entry_count -= len(cached[0])
+
+    def listing(self, path):
+        """
+        返回目录的条目列表，调用方不应修改返回的列表
+
+        异常:
+            OSError: 目录无法读取(不缓存)
+        """
+        key = self._key(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is not None and mtime_ns is not None and cached[1] == mtime_ns:
+                self._stats["listing_hits"] += 1
+                self._stats["saved_seconds"] += cached[2]
+                if cached[3] is not None:
+                    cached[3] -= 1
+                    if cached[3] <= 0:
+                        self._drop(key)
+                        return cached[0]
+                self._listings.move_to_end(key)
+                return cached[0]
+
+        start = time.perf_counter()
+        with os.scandir(path) as it:
+            entries = list(it)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["listing_misses"] += 1
+            # 目录有变化时重新列出，之前的取用仍然计数
+            cached = self._listings.get(key)
+            self._drop(key)
+            remaining = cached[3] if cached is not None else self._consumers(key)
+            if remaining is not None:
+                remaining -= 1
+                if remaining <= 0:
+                    return entries
+            if mtime_ns is not None:
+                self._listings[key] = [entries, mtime_ns, elapsed, remaining]
+                self._entry_count += len(entries)
+                while self._entry_count > self.max_entries and self._listings:
+                    self._drop(next(iter(self._listings)))
+            return entries
+
+    def file_hash(self, path):
+        """返回源文件的哈希值，文件自上次计算后没有变化时直接使用缓存"""
+        key = self._key(path)
+        while True:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                return calculate_file_hash(path)
+            state = (file_stat.st_size, file_stat.st_mtime_ns)
+
+            with self._lock:
+                cached = self._hashes.get(key)
+                if cached is not None and cached[:2] == state:
+                    self._stats["hash_hits"] += 1
+                    self._stats["saved_seconds"] += cached[3]
+                    return cached[2]
+                pending = self._hashing.get(key)
+                if pending is None:
+                    pending = self._hashing[key] = threading.Event()
+                    break
+            # 另一个任务正在计算同一个文件，等待后再读取缓存
+            pending.wait()
+
+        try:
+            start = time.perf_counter()
+            file_hash = calculate_file_hash(path)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats["hash_misses"] += 1
+                if file_hash is not None:
+                    self._hashes[key] = state + (file_hash, elapsed)
+            return file_hash
+        finally:
+            with self._lock:
+                del self._hashing[key]
+            pending.set()
+
+    def stats(self):
+        """
+        返回共享结果的复用统计
+
+        返回:
+            dict: listing_hits/listing_misses(目录列表复用/实际列出次数)、
+                  hash_hits/hash_misses(哈希复用/实际计算次数)、saved_seconds(复用节省的估计时间)
+        """
+        with self._lock:
+            return dict(self._stats)
+
+def overlapping_sources(source_dirs):
+    """
+    找出与其他源目录相同或相互包含的源目录
+
+    参数:
+        source_dirs: 源目录路径列表
+
+    返回:
+        set: 其中与至少一个其他源目录重叠的目录(规范化后的绝对路径)
+    """
+    paths = sorted(set(os.path.normpath(os.path.abspath(path)) for path in source_dirs))
+    counts = {}
+    for path in source_dirs:
+        key = os.path.normpath(os.path.abspath(path))
+        counts[key] = counts.get(key, 0) + 1
+
+    overlapping = set(path for path, count in counts.items() if count > 1)
+    # 排序后，包含某个目录的上级目录一定排在它之前
+    for i, path in enumerate(paths):
+        prefix = os.path.join(path, '')
+        for other in paths[i + 1:]:
+            if not other.startswith(prefix):
+                if other > prefix:
+                    break
+                continue
+            overlapping.add(path)
+            overlapping.add(other)
+    return overlapping
@@ -0,0 +1,272 @@
+"""
+目录快照模块，只用stat信息记录目录树的状态，比较两次快照得到变化的路径
+
+快照不读取文件内容，一次扫描的代价只有列目录和stat，适合没有文件监视时的轮询。
+源目录和目标目录的快照可以保存为状态文件，下次启动时与新的快照比较，只同步其间的变化。
+"""
+
+import os
+import json
+import hashlib
+
+from .scanner import scan_tree
+
+# 状态文件格式版本，格式变化后旧文件不再使用
+STATE_VERSION = 1
+
+def take_snapshot(source_dir, ignore_rules=None, workers=1):
+    """
+    扫描目录树，记录每个未被忽略的路径的stat信息
+
+    参数:
+        source_dir: 要扫描的目录
+        ignore_rules: 可选的IgnoreRules对象
+        workers: 并发列目录的线程数
+
+    返回:
+        dict: 相对路径 -> (大小, 修改时间(纳秒), inode, 是否目录)
+    """
+    snapshot = {}
+    for root, rel_path, dirs, files in scan_tree(source_dir, ignore_rules, workers=workers):
+        for dir_name in dirs:
+            dir_rel_path = os.path.join(rel_path, dir_name) if rel_path != '.' else dir_name
+            try:
+                dir_stat = os.stat(os.path.join(root, dir_name))
+            except OSError:
+                continue
+            snapshot[dir_rel_path] = (0, dir_stat.st_mtime_ns, dir_stat.st_ino, True)
+
+        for entry in files:
+            file_rel_path = os.path.join(rel_path, entry.name) if rel_path != '.' else entry.name
+            try:
+                file_stat = entry.stat()
+            except OSError:
+                continue
+            snapshot[file_rel_path] = (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, False)
+    return snapshot
+
+def _has_ancestor(path, paths):
+    """检查path的任一上级目录是否在paths中"""
+    parent = os.path.dirname(path)
+    while parent:
+        if parent in paths:
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+def _children(snapshot):
+    """按上级目录分组快照中的路径"""
+    children = {}
+    for path in snapshot:
+        children.setdefault(os.path.dirname(path), []).append(path)
+    return children
+
+def diff_snapshots(old, new):
+    """
+    比较两次快照
+
+    新路径与消失路径的inode相同(文件还要求大小和修改时间相同)时视为移动；目录的inode可能在删除后
+    被新目录重用，因此目录还要求至少一个直接子项随之移动(名称和inode相同)，或者两者都是空目录。
+    随目录一起移动的子路径、随目录一起删除的子路径不再单独列出；移动目录中被删除或移出的子路径
+    改用移动后的路径，与sync_paths先执行移动的顺序一致。
+    目录只报告新建的空目录、删除和移动，其修改时间的变化由其中的条目体现。
+
+    参数:
+        old: 上一次的快照
+        new: 本次的快照
+
+    返回:
+        list: sync_paths使用的变化记录 (类型, 相对路径, 移动后的相对路径)
+    """
+    added = [path for path in new if path not in old]
+    removed = [path for path in old if path not in new]
+    old_children = _children(old)
+    new_children = _children(new)
+
+    def same_children(source, path):
+        entries = new_children.get(path, ())
+        if not entries:
+            return not old_children.get(source)
+        for child in entries:
+            previous = old.get(os.path.join(source, os.path.basename(child)))
+            if previous is not None and previous[2] == new[child][2]:
+                return True
+        return False
+
+    # 按inode找出移动的路径，inode为0的文件系统不支持识别
+    removed_by_inode = {old[path][2]: path for path in removed if old[path][2]}
+    moves = {}
+    for path in added:
+        size, mtime_ns, inode, is_dir = new[path]
+        source = removed_by_inode.get(inode) if inode else None
+        if source is None or old[source][3] != is_dir:
+            continue
+        if same_children(source, path) if is_dir else old[source][:2] == (size, mtime_ns):
+            moves[path] = source
+
+    moved_dirs = [(source, path) for path, source in moves.items() if new[path][3]]
+
+    def implied_by_dir_move(source, path):
+        for dir_source, dir_path in moved_dirs:
+            if source.startswith(dir_source + os.sep) and path == dir_path + source[len(dir_source):]:
+                return True
+        return False
+
+    def relocate(source):
+        """移动目录中的旧路径在执行完上级目录的移动后所在的位置"""
+        best = None
+        for dir_source, dir_path in moved_dirs:
+            if source.startswith(dir_source + os.sep) and (best is None or len(dir_source) > len(best[0])):
+                best = (dir_source, dir_path)
+        return best[1] + source[len(best[0]):] if best else source
+
+    changes = []
+    moved_sources = set(moves.values())
+    deleted = set(path for path in removed if path not in moved_sources)
+    for path in sorted(deleted):
+        if not _has_ancestor(path, deleted):
+            changes.append(('deleted', relocate(path), None))
+
+    # 上级目录先移动，子路径的移动才能在新位置找到它
+    for path, source in sorted(moves.items(), key=lambda item: item[1].count(os.sep)):
+        if not implied_by_dir_move(source, path):
+            changes.append(('moved', relocate(source), path))
+
+    parents = set(os.path.dirname(path) for path in new)
+    for path in added:
+        if path in moves:
+            continue
+        # 新目录中的条目会各自列出，只有空目录需要单独创建
+        if new[path][3] and path in parents:
+            continue
+        changes.append(('modified', path, None))
+
+    for path, state in new.items():
+        previous = old.get(path)
+        if previous is None:
+            continue
+        if previous[3] != state[3] or (not state[3] and previous[:3] != state[:3]):
+            changes.append(('modified', path, None))
+
+    return changes
+
+def advance_snapshot(old, new, failed):
+    """
+    把比较基准从old推进到new，同步失败的路径及其子路径保留old中的状态
+
+    失败的路径在下一次比较时仍表现为变化，从而被重试。
+
+    参数:
+        old: 上一次的基准快照
+        new: 本次的快照
+        failed: 同步失败的相对路径，'.'表示整个目录树
+
+    返回:
+        dict: 新的基准快照
+    """
+    failed = set(failed)
+    if not failed:
+        return new
+    if '.' in failed:
+        return dict(old)
+
+    def under_failed(path):
+        while path:
+            if path in failed:
+                return True
+            path = os.path.dirname(path)
+        return False
+
+    snapshot = {path: state for path, state in new.items() if not under_failed(path)}
+    for path, state in old.items():
+        if under_failed(path):
+            snapshot[path] = state
+    return snapshot
+
+def default_state_file(source_dir, target_dir):
+    """返回一对源/目标目录默认的状态文件路径 ~/.huangyz_sync/state/<哈希>.json"""
+    key = f"{os.path.abspath(source_dir)}\n{os.path.abspath(target_dir)}".encode('utf-8')
+    name = hashlib.sha1(key).hexdigest()[:16] + '.json'
+    return os.path.join(os.path.expanduser('~'), '.huangyz_sync', 'state', name)
+
+def save_state(state_file, source_dir, target_dir, source_snapshot, target_snapshot, dirty=()):
+    """
+    保存已同步的状态
+    
+    参数:
+        state_file: 状态文件路径
+        source_dir: 源目录
+        target_dir: 目标目录
+        source_snapshot: 与目标一致时的源目录快照
+        target_snapshot: 同时的目标目录快照
+        dirty: 快照中可能尚未同步的相对路径，下次启动时重新同步
+    
+    返回:
+        bool: 是否保存成功
+    """
+    state = {
+        "version": STATE_VERSION,
+        "source_dir": os.path.abspath(source_dir),
+        "target_dir": os.path.abspath(target_dir),
+        "source": source_snapshot,
+        "target": target_snapshot,
+        "dirty": sorted(set(dirty))
+    }
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+        # 先写临时文件再替换，中途退出不会留下损坏的状态文件
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, state_file)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        print(f"保存同步状态时出错: {e}")
+        return False
+
+def load_state(state_file, source_dir, target_dir):
+    """
+    读取状态文件
+    
+    返回:
+        tuple: (源目录快照, 目标目录快照, 未同步的路径列表)；文件不存在、格式不符或
+               不属于这对目录时返回None
+    """
+    if not state_file or not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取同步状态时出错: {e}")
+        return None
+    if state.get("version") != STATE_VERSION or \
+            state.get("source_dir") != os.path.abspath(source_dir) or \
+            state.get("target_dir") != os.path.abspath(target_dir):
+        return None
+    source_snapshot = {path: tuple(value) for path, value in state.get("source", {}).items()}
+    target_snapshot = {path: tuple(value) for path, value in state.get("target", {}).items()}
+    return source_snapshot, target_snapshot, state.get("dirty", [])
+
+def state_changes(state, source_snapshot, target_snapshot):
+    """
+    比较保存的状态和当前快照，得到需要同步的变化
+    
+    源目录的变化按原样同步；目标目录在两次运行之间被改动的路径按源目录的当前状态重新同步。
+    
+    参数:
+        state: load_state的返回值
+        source_snapshot: 当前的源目录快照
+        target_snapshot: 当前的目标目录快照
+    
+    返回:
+        list: sync_paths使用的变化记录
+    """
+    old_source, old_target, dirty = state
+    changes = diff_snapshots(old_source, source_snapshot)
+    for kind, rel_path, dest_rel_path in diff_snapshots(old_target, target_snapshot):
+        changes.append(('modified', rel_path, None))
+        if dest_rel_path:
+            changes.append(('modified', dest_rel_path, None))
+    changes.extend(('modified', rel_path, None) for rel_path in dirty)
+    return changes
@@ -0,0 +1,233 @@
+"""
+溢出存储模块，条目数量超过阈值后把扫描清单和操作记录写入SQLite临时库
+
+用于上千万文件的目录树：内存中只保留阈值以内的条目，超出部分写入磁盘，
+源目录和目标目录的差异通过SQLite的排序索引在磁盘上合并计算。
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+# 溢出之后每攒够这么多条目批量写入一次
+SPILL_BATCH_SIZE = 10000
+
+# 排序键中用来代替路径分隔符的字符，保证目录之后紧跟其全部子孙路径
+_SORT_SEPARATOR = "\x01"
+
+def _sort_key(path):
+    return path.replace(os.sep, _SORT_SEPARATOR)
+
+def _remove_file(path):
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+class SpillStore:
+    """管理一个按需创建的SQLite临时库，为多个溢出列表和路径集合提供存储"""
+
+    def __init__(self, threshold=1000000, directory=None):
+        """
+        初始化溢出存储
+
+        参数:
+            threshold: 单个列表或集合在内存中保留的条目上限，超过后写入磁盘
+            directory: 临时库所在目录，默认使用系统临时目录
+        """
+        self.threshold = threshold
+        self.directory = directory
+        self._conn = None
+        self._path = None
+        self._lock = threading.RLock()
+        self._finalizer = None
+
+    @property
+    def spilled(self):
+        """是否已经有数据写入磁盘"""
+        return self._conn is not None
+
+    def connection(self):
+        """返回临时库连接，首次调用时创建"""
+        with self._lock:
+            if self._conn is None:
+                fd, self._path = tempfile.mkstemp(prefix="huangyz_sync_", suffix=".db", dir=self.directory)
+                os.close(fd)
+                self._conn = sqlite3.connect(self._path, check_same_thread=False)
+                # 临时数据，不需要日志和同步写盘
+                self._conn.execute("PRAGMA journal_mode=OFF")
+                self._conn.execute("PRAGMA synchronous=OFF")
+                self._conn.execute("PRAGMA temp_store=FILE")
+                self._conn.execute("PRAGMA cache_size=-65536")
+                self._finalizer = weakref.finalize(self, _remove_file, self._path)
+                print(f"条目数量超过 {self.threshold}，已启用磁盘临时库: {self._path}")
+            return self._conn
+
+    def create_list(self):
+        """创建一个溢出列表"""
+        return SpillList(self)
+
+    def create_path_set(self):
+        """创建一个溢出路径集合"""
+        return SpillPathSet(self)
+
+    def close(self):
+        """关闭并删除临时库"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            if self._finalizer is not None:
+                self._finalizer()
+                self._finalizer = None
+
+class SpillList:
+    """只追加的列表，条目超过阈值后写入磁盘，支持len()和遍历"""
+
+    _counter = 0
+
+    def __init__(self, store):
+        self.store = store
+        self._items = []
+        self._spilled_count = 0
+        self._table = None
+
+    def _create_table(self):
+        SpillList._counter += 1
+        self._table = f"list_{SpillList._counter}"
+        self.store.connection().execute(f"CREATE TABLE {self._table} (value TEXT)")
+
+    def _flush(self):
+        conn = self.store.connection()
+        conn.executemany(f"INSERT INTO {self._table} (value) VALUES (?)", ((v,) for v in self._items))
+        conn.commit()
+        self._spilled_count += len(self._items)
+        self._items = []
+
+    def append(self, value):
+        with self.store._lock:
+            self._items.append(value)
+            if self._table is None:
+                if len(self._items) > self.store.threshold:
+                    self._create_table()
+                    self._flush()
+            elif len(self._items) >= SPILL_BATCH_SIZE:
+                self._flush()
+
+    def __len__(self):
+        return self._spilled_count + len(self._items)
+
+    def __iter__(self):
+        with self.store._lock:
+            if self._table is not None:
+                self._flush()
+            items = list(self._items)
+        if self._table is not None:
+            yield from _read_table(self.store, self._table, "value")
+        yield from items
+
+    def __repr__(self):
+        return f"SpillList(len={len(self)})"
+
+class SpillPathSet:
+    """路径集合，条目超过阈值后写入磁盘，用于源/目标清单的差异计算"""
+
+    _counter = 0
+
+    def __init__(self, store):
+        self.store = store
+        self._paths = set()
+        self._table = None
+
+    def _flush(self):
+        conn = self.store.connection()
+        conn.executemany(f"INSERT OR IGNORE INTO {self._table} (key) VALUES (?)",
+                         ((_sort_key(p),) for p in self._paths))
+        conn.commit()
+        self._paths = set()
+
+    def add(self, path):
+        with self.store._lock:
+            self._paths.add(path)
+            if self._table is None:
+                if len(self._paths) > self.store.threshold:
+                    SpillPathSet._counter += 1
+                    self._table = f"paths_{SpillPathSet._counter}"
+                    self.store.connection().execute(
+                        f"CREATE TABLE {self._table} (key TEXT PRIMARY KEY) WITHOUT ROWID")
+                    self._flush()
+            elif len(self._paths) >= SPILL_BATCH_SIZE:
+                self._flush()
+
+    def missing(self, entries):
+        """
+        找出不在本集合中的条目
+
+        参数:
+            entries: 可迭代的 (路径, 是否目录)
+
+        返回:
+            生成器，按排序键顺序产生不在集合中的 (路径, 是否目录)；
+            目录之后紧跟其子孙路径，调用方可以据此跳过已删除目录下的条目
+        """
+        if self._table is None:
+            missing = [(path, is_dir) for path, is_dir in entries if path not in self._paths]
+            missing.sort(key=lambda item: _sort_key(item[0]))
+            yield from missing
+            return
+
+        with self.store._lock:
+            self._flush()
+            SpillPathSet._counter += 1
+            other = f"paths_{SpillPathSet._counter}"
+            result = f"missing_{SpillPathSet._counter}"
+            self.store.connection().execute(
+                f"CREATE TABLE {other} (key TEXT PRIMARY KEY, is_dir INTEGER) WITHOUT ROWID")
+
+        # 分批写入，遍历目标目录期间不长时间占用锁
+        batch = []
+        for path, is_dir in entries:
+            batch.append((_sort_key(path), 1 if is_dir else 0))
+            if len(batch) >= SPILL_BATCH_SIZE:
+                self._insert_entries(other, batch)
+                batch = []
+        self._insert_entries(other, batch)
+
+        with self.store._lock:
+            conn = self.store.connection()
+            # 两张表都按主键有序存储，差异按顺序归并两个索引得到，结果按rowid保持排序
+            conn.execute(
+                f"CREATE TABLE {result} AS SELECT o.key AS key, o.is_dir AS is_dir FROM {other} o "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {self._table} s WHERE s.key = o.key) ORDER BY o.key")
+            conn.execute(f"DROP TABLE {other}")
+            conn.commit()
+
+        for key, is_dir in _read_table(self.store, result, "key, is_dir"):
+            yield key.replace(_SORT_SEPARATOR, os.sep), bool(is_dir)
+        with self.store._lock:
+            self.store.connection().execute(f"DROP TABLE {result}")
+
+    def _insert_entries(self, table, batch):
+        if not batch:
+            return
+        with self.store._lock:
+            conn = self.store.connection()
+            conn.executemany(f"INSERT OR IGNORE INTO {table} (key, is_dir) VALUES (?, ?)", batch)
+            conn.commit()
+
+def _read_table(store, table, columns):
+    """按rowid分批读取表中的数据，每批单独加锁"""
+    last = 0
+    while True:
+        with store._lock:
+            batch = store.connection().execute(
+                f"SELECT rowid, {columns} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last, SPILL_BATCH_SIZE)).fetchall()
+        if not batch:
+            return
+        for row in batch:
+            yield row[1] if len(row) == 2 else row[1:]
+        last = batch[-1][0]
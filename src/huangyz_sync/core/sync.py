@@ -6,12 +6,19 @@ import os
 import time
 import json
 
-from .file_manager import FileManager
 from ..utils.ignore import IgnoreRules
-from ..utils.common import calculate_file_hash, WATCHDOG_AVAILABLE
-from ..utils.watch import FolderWatcher
+from ..utils.common import format_size, calculate_file_hash
+from ..utils.watch import FolderWatcher, WATCH_AVAILABLE
+from .file_manager import FileManager
+from .pipeline import SyncPipeline
+from .store import SpillStore
+from .snapshot import take_snapshot, diff_snapshots, advance_snapshot, default_state_file, save_state, load_state, \
+    state_changes
 
-def sync_directories(source_dir, target_dir, delete_extra=False, compare_content=True, ignore_rules=None):
+def sync_directories(source_dir, target_dir, delete_extra=False, compare_content=True, ignore_rules=None,
+                     io_hints=None, scheduler=None, scan_workers=1, compare_workers=1,
+                     transfer_workers=1, queue_size=1000, spill_threshold=None, spill_dir=None, subtree=None,
+                     source_cache=None):
     """
     同步两个目录的内容
     
@@ -21,6 +28,16 @@ def sync_directories(source_dir, target_dir, delete_extra=False, compare_content
         delete_extra: 是否删除目标目录中多余的文件
         compare_content: 是否通过内容比较决定是否需要复制（而不仅仅依赖修改时间）
         ignore_rules: IgnoreRules对象或忽略规则文件路径
+        io_hints: 复制文件时使用的I/O提示(预分配、fadvise、O_DIRECT)，参见FileManager.copy_file
+        scheduler: 可选的SyncScheduler，比较和复制队列中已缓冲的文件按其优先级顺序处理
+        scan_workers: 并发列出源目录的线程数，高延迟的网络文件系统上可以调大
+        compare_workers: 比较(哈希)文件的线程数
+        transfer_workers: 复制文件的线程数
+        queue_size: 各阶段之间队列的容量上限，决定流水线占用内存的上限
+        spill_threshold: 条目数量超过该值时，操作记录和源/目标清单写入磁盘临时库，为None时全部保存在内存中
+        spill_dir: 磁盘临时库所在目录，默认使用系统临时目录
+        subtree: 只同步源目录中的这个子目录(相对路径)，忽略规则仍按相对源目录的路径匹配
+        source_cache: 可选的SharedSourceCache，源目录相同或相互包含的多个任务共用目录列表和文件哈希
     """
     try:
         # 确保目标目录存在
@@ -36,145 +53,44 @@ def sync_directories(source_dir, target_dir, delete_extra=False, compare_content
                 ignore_rules = IgnoreRules(patterns=ignore_rules if isinstance(ignore_rules, list) else [])
         else:
             ignore_rules = None
+        if ignore_rules is not None:
+            # 重新检查嵌套忽略文件，未修改的文件沿用已编译的规则
+            ignore_rules.refresh()
+        
+        # 超大目录树使用溢出存储，内存中只保留阈值以内的条目
+        spill_store = SpillStore(spill_threshold, spill_dir) if spill_threshold else None
+        new_list = spill_store.create_list if spill_store else list
         
         # 记录操作日志
         operations = {
-            "copied": [],
-            "updated": [],
-            "deleted": [],
-            "skipped": [],
-            "ignored": []
+            "copied": new_list(),
+            "updated": new_list(),
+            "deleted": new_list(),
+            "skipped": new_list(),
+            "ignored": new_list(),
+            # 复制、比较或删除失败的路径(相对源目录)，下次同步时需要重试
+            "failed": new_list(),
+            # 复制的逻辑字节数与实际写入字节数（稀疏文件的空洞不计入实际写入）
+            "stats": {"logical_bytes": 0, "physical_bytes": 0}
         }
         
-        # 遍历源目录中的所有文件和文件夹
-        for root, dirs, files in os.walk(source_dir):
-            # 计算相对路径，用于在目标目录中创建对应结构
-            rel_path = os.path.relpath(root, source_dir)
-            target_root = os.path.join(target_dir, rel_path) if rel_path != '.' else target_dir
-            
-            # 如果当前目录应该被忽略，跳过
-            if ignore_rules and rel_path != '.' and ignore_rules.should_ignore(rel_path, True):
-                operations["ignored"].append(root)
-                # 从dirs中移除所有子目录，避免继续遍历
-                dirs[:] = []
-                continue
-            
-            # 过滤掉被忽略的目录
-            if ignore_rules:
-                i = 0
-                while i < len(dirs):
-                    dir_path = os.path.join(rel_path, dirs[i]) if rel_path != '.' else dirs[i]
-                    if ignore_rules.should_ignore(dir_path, True):
-                        operations["ignored"].append(os.path.join(root, dirs[i]))
-                        dirs.pop(i)
-                    else:
-                        i += 1
-            
-            # 确保目标目录中的子目录存在
-            for dir_name in dirs:
-                dir_rel_path = os.path.join(rel_path, dir_name) if rel_path != '.' else dir_name
-                
-                # 再次检查目录是否应该被忽略
-                if ignore_rules and ignore_rules.should_ignore(dir_rel_path, True):
-                    continue
-                
-                target_dir_path = os.path.join(target_dir, dir_rel_path)
-                if not os.path.exists(target_dir_path):
-                    os.makedirs(target_dir_path)
-                    print(f"已创建目标子目录: {target_dir_path}")
-            
-            # 处理文件
-            for file_name in files:
-                # 检查文件是否应该被忽略
-                file_rel_path = os.path.join(rel_path, file_name) if rel_path != '.' else file_name
-                if ignore_rules and ignore_rules.should_ignore(file_rel_path, False):
-                    operations["ignored"].append(os.path.join(root, file_name))
-                    continue
-                
-                source_file = os.path.join(root, file_name)
-                target_file = os.path.join(target_root, file_name)
-                
-                # 如果目标文件不存在，直接复制
-                if not os.path.exists(target_file):
-                    FileManager.copy_file(source_file, target_file)
-                    operations["copied"].append(target_file)
-                    continue
-                
-                # 检查文件是否需要更新
-                need_update = False
-                if compare_content:
-                    # 通过哈希值比较文件内容
-                    source_hash = calculate_file_hash(source_file)
-                    target_hash = calculate_file_hash(target_file)
-                    need_update = source_hash != target_hash
-                else:
-                    # 通过修改时间比较
-                    source_mtime = os.path.getmtime(source_file)
-                    target_mtime = os.path.getmtime(target_file)
-                    need_update = source_mtime > target_mtime
-                
-                if need_update:
-                    FileManager.copy_file(source_file, target_file)
-                    operations["updated"].append(target_file)
-                else:
-                    operations["skipped"].append(target_file)
-        
-        # 如果需要，删除目标目录中多余的文件
-        if delete_extra:
-            for root, dirs, files in os.walk(target_dir):
-                # 计算相对路径，用于在源目录中查找对应文件
-                rel_path = os.path.relpath(root, target_dir)
-                source_root = os.path.join(source_dir, rel_path) if rel_path != '.' else source_dir
-                
-                # 如果当前目录应该被忽略，跳过
-                if ignore_rules and rel_path != '.' and ignore_rules.should_ignore(rel_path, True):
-                    continue
-                
-                # 处理文件
-                i = 0
-                while i < len(files):
-                    file_name = files[i]
-                    file_rel_path = os.path.join(rel_path, file_name) if rel_path != '.' else file_name
-                    
-                    # 如果文件应该被忽略，跳过
-                    if ignore_rules and ignore_rules.should_ignore(file_rel_path, False):
-                        i += 1
-                        continue
-                    
-                    target_file = os.path.join(root, file_name)
-                    source_file = os.path.join(source_root, file_name)
-                    
-                    # 如果源文件不存在，删除目标文件
-                    if not os.path.exists(source_file):
-                        FileManager.delete_file(target_file)
-                        operations["deleted"].append(target_file)
-                    
-                    i += 1
-                
-                # 处理多余的目录（从后向前遍历，确保先处理子目录）
-                i = len(dirs) - 1
-                while i >= 0:
-                    dir_name = dirs[i]
-                    dir_rel_path = os.path.join(rel_path, dir_name) if rel_path != '.' else dir_name
-                    
-                    # 如果目录应该被忽略，跳过
-                    if ignore_rules and ignore_rules.should_ignore(dir_rel_path, True):
-                        i -= 1
-                        continue
-                    
-                    target_dir_path = os.path.join(root, dir_name)
-                    source_dir_path = os.path.join(source_root, dir_name)
-                    
-                    if not os.path.exists(source_dir_path):
-                        try:
-                            FileManager.delete_directory(target_dir_path, force=True)
-                            operations["deleted"].append(target_dir_path)
-                            # 防止os.walk继续处理已删除的目录
-                            dirs.pop(i)
-                        except Exception as e:
-                            print(f"删除目录时出错: {e}")
-                    
-                    i -= 1
+        # 扫描、比较、传输和删除各阶段通过有界队列并行执行
+        pipeline = SyncPipeline(
+            source_dir, target_dir,
+            ignore_rules=ignore_rules,
+            delete_extra=delete_extra,
+            compare_content=compare_content,
+            io_hints=io_hints,
+            scheduler=scheduler,
+            scan_workers=scan_workers,
+            compare_workers=compare_workers,
+            transfer_workers=transfer_workers,
+            queue_size=queue_size,
+            spill_store=spill_store,
+            subtree=subtree,
+            source_cache=source_cache
+        )
+        pipeline.run(operations)
         
         # 打印同步结果
         print(f"同步完成! 源目录: {source_dir} -> 目标目录: {target_dir}")
@@ -183,17 +99,195 @@ def sync_directories(source_dir, target_dir, delete_extra=False, compare_content
         print(f"更新了 {len(operations['updated'])} 个文件")
         print(f"删除了 {len(operations['deleted'])} 个多余文件")
         print(f"跳过了 {len(operations['skipped'])} 个相同文件")
+        if len(operations['failed']):
+            print(f"有 {len(operations['failed'])} 个路径同步失败")
+        print(f"传输了 {format_size(operations['stats']['logical_bytes'])} 逻辑数据，"
+              f"实际写入 {format_size(operations['stats']['physical_bytes'])}")
         
         return operations
     except Exception as e:
         print(f"同步目录时出错: {e}")
         return None
 
+def sync_paths(source_dir, target_dir, changes, delete_extra=True, compare_content=True,
+               ignore_rules=None, io_hints=None, scheduler=None):
+    """
+    只同步发生变化的路径，代价与变化数量成正比，而不是与整个目录树成正比
+    
+    每个变化的路径都按源目录的当前状态处理：文件存在时复制或更新，目录存在时同步该子目录，
+    不存在时从目标目录删除。移动的路径在目标目录中直接重命名，不再重新复制。
+    
+    参数:
+        source_dir: 源目录路径
+        target_dir: 目标目录路径
+        changes: 可迭代的变化记录 (类型, 相对路径, 移动后的相对路径)，类型为
+                 'modified'(新建或修改)、'deleted' 或 'moved'，非移动记录的第三项为None
+        delete_extra: 是否删除源目录中已不存在的路径
+        compare_content: 是否通过内容比较决定是否需要复制（而不仅仅依赖修改时间）
+        ignore_rules: IgnoreRules对象
+        io_hints: 复制文件时使用的I/O提示，参见FileManager.copy_file
+        scheduler: 可选的SyncScheduler，变化的路径(移动之后)按其优先级顺序同步
+    
+    返回:
+        dict: 与sync_directories相同的操作记录(failed为同步失败的相对路径)，另有moved记录在目标目录中
+              重命名的路径；出错时返回None
+    """
+    try:
+        operations = {
+            "copied": [],
+            "updated": [],
+            "deleted": [],
+            "skipped": [],
+            "ignored": [],
+            "failed": [],
+            "moved": [],
+            "stats": {"logical_bytes": 0, "physical_bytes": 0}
+        }
+        
+        # 先执行移动，再按源目录的当前状态逐个同步涉及的路径
+        paths = []
+        for kind, rel_path, dest_rel_path in changes:
+            if kind == "moved":
+                moved = _move_target(source_dir, target_dir, rel_path, dest_rel_path, ignore_rules, operations)
+                if not moved:
+                    paths.append(rel_path)
+                # 整个目录重命名后不再比较其中的条目，条目自身的变化会有各自的记录
+                if not (moved and os.path.isdir(os.path.join(target_dir, dest_rel_path))):
+                    paths.append(dest_rel_path)
+            else:
+                paths.append(rel_path)
+        
+        paths = list(dict.fromkeys(paths))
+        if scheduler is not None:
+            # 每次同步使用独立的队列，不影响共用的调度器
+            ordered = scheduler.clone()
+            for rel_path in paths:
+                ordered.push({"source": os.path.join(source_dir, rel_path), "rel_path": rel_path})
+            paths = [item["rel_path"] for item in ordered.drain()]
+        for rel_path in paths:
+            _sync_path(source_dir, target_dir, rel_path, delete_extra, compare_content,
+                       ignore_rules, io_hints, operations, scheduler)
+        
+        changed = sum(len(operations[key]) for key in ("copied", "updated", "deleted", "moved"))
+        print(f"增量同步完成，处理了 {len(paths)} 个变化路径，实际变更 {changed} 项")
+        return operations
+    except Exception as e:
+        print(f"增量同步时出错: {e}")
+        return None
+
+def _is_ignored(ignore_rules, rel_path, is_dir):
+    """检查路径或其任一上级目录是否被忽略"""
+    if not ignore_rules:
+        return False
+    parts = rel_path.replace('\\', '/').split('/')
+    for i in range(1, len(parts)):
+        if ignore_rules.should_ignore('/'.join(parts[:i]), True):
+            return True
+    return ignore_rules.should_ignore(rel_path, is_dir)
+
+def _move_target(source_dir, target_dir, rel_path, dest_rel_path, ignore_rules, operations):
+    """在目标目录中执行重命名，条件不满足时返回False，由调用方按普通变化处理"""
+    old_target = os.path.join(target_dir, rel_path)
+    new_target = os.path.join(target_dir, dest_rel_path)
+    new_source = os.path.join(source_dir, dest_rel_path)
+    is_dir = os.path.isdir(new_source)
+    
+    if os.path.lexists(os.path.join(source_dir, rel_path)) or not os.path.lexists(old_target) \
+            or os.path.lexists(new_target) or not os.path.lexists(new_source):
+        return False
+    if _is_ignored(ignore_rules, rel_path, is_dir) or _is_ignored(ignore_rules, dest_rel_path, is_dir):
+        return False
+    
+    try:
+        os.makedirs(os.path.dirname(new_target), exist_ok=True)
+        os.rename(old_target, new_target)
+    except OSError as e:
+        print(f"重命名目标路径时出错: {e}")
+        return False
+    print(f"重命名成功: {old_target} -> {new_target}")
+    operations["moved"].append((old_target, new_target))
+    return True
+
+def _sync_path(source_dir, target_dir, rel_path, delete_extra, compare_content, ignore_rules, io_hints, operations,
+               scheduler=None):
+    """按源目录的当前状态同步一个路径"""
+    source_path = os.path.join(source_dir, rel_path) if rel_path != '.' else source_dir
+    target_path = os.path.join(target_dir, rel_path) if rel_path != '.' else target_dir
+    is_dir = os.path.isdir(source_path)
+    
+    if rel_path != '.' and _is_ignored(ignore_rules, rel_path, is_dir):
+        operations["ignored"].append(source_path)
+        return
+    
+    if is_dir:
+        # 新建或移入的目录：只同步这个子目录
+        if os.path.lexists(target_path) and not os.path.isdir(target_path):
+            FileManager.delete_file(target_path)
+        result = sync_directories(
+            source_dir, target_dir,
+            delete_extra=delete_extra,
+            compare_content=compare_content,
+            ignore_rules=ignore_rules,
+            io_hints=io_hints,
+            scheduler=scheduler,
+            subtree=rel_path
+        )
+        if result:
+            for key, value in result.items():
+                if key == "stats":
+                    for name, count in value.items():
+                        operations["stats"][name] = operations["stats"].get(name, 0) + count
+                else:
+                    operations[key].extend(value)
+        else:
+            operations["failed"].append(rel_path)
+        return
+    
+    if not os.path.exists(source_path):
+        # 源路径已不存在：从目标目录删除
+        if delete_extra and os.path.lexists(target_path):
+            if os.path.isdir(target_path) and not os.path.islink(target_path):
+                deleted = FileManager.delete_directory(target_path, force=True)
+            else:
+                deleted = FileManager.delete_file(target_path)
+            if deleted:
+                operations["deleted"].append(target_path)
+            else:
+                operations["failed"].append(rel_path)
+        return
+    
+    if os.path.isdir(target_path) and not os.path.islink(target_path):
+        FileManager.delete_directory(target_path, force=True)
+    
+    action = "updated" if os.path.exists(target_path) else "copied"
+    if action == "updated":
+        try:
+            # 检查文件是否需要更新
+            if compare_content:
+                need_update = calculate_file_hash(source_path) != calculate_file_hash(target_path)
+            else:
+                need_update = os.path.getmtime(source_path) > os.path.getmtime(target_path)
+        except OSError as e:
+            print(f"比较文件时出错: {e}")
+            operations["failed"].append(rel_path)
+            return
+        if not need_update:
+            operations["skipped"].append(target_path)
+            return
+    else:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    
+    if FileManager.copy_file(source_path, target_path, stats=operations["stats"], io_hints=io_hints):
+        operations[action].append(target_path)
+    else:
+        operations["failed"].append(rel_path)
+
 def save_operations_log(operations, log_file):
     """保存操作日志到文件"""
     try:
         with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(operations, f, ensure_ascii=False, indent=2)
+            # 溢出存储中的操作记录按列表写出
+            json.dump(operations, f, ensure_ascii=False, indent=2, default=list)
         print(f"操作日志已保存到: {log_file}")
         return True
     except Exception as e:
@@ -215,26 +309,52 @@ class AutoSync:
     """持续自动同步两个目录"""
     
     def __init__(self, source_dir, target_dir, interval=60, 
-                 use_watchdog=True, delete_extra=False, ignore_rules=None):
+                 use_watchdog=True, delete_extra=False, ignore_rules=None, scheduler=None,
+                 polling_mode="snapshot", min_interval=1, hub=None, settle_time=2.0,
+                 warm_start=True, state_file=None, state_interval=600, full_sync_interval=3600):
         """
         初始化自动同步器
         
         参数:
             source_dir: 源目录
             target_dir: 目标目录
-            interval: 使用轮询方式时的同步间隔(秒)
-            use_watchdog: 是否使用watchdog监视文件变化(推荐)
+            interval: 使用轮询方式时的同步间隔(秒)，快照轮询时为空闲时的最长间隔
+            use_watchdog: 是否监视文件变化(推荐)，没有watchdog时在Linux上使用内置的inotify后端
             delete_extra: 是否删除目标目录中多余的文件
             ignore_rules: IgnoreRules对象、忽略规则文件路径或规则列表
+            scheduler: 可选的SyncScheduler，决定每次同步中文件的处理顺序
+            polling_mode: 轮询方式，'snapshot'(比较stat快照，只同步变化的路径) 或 'full'(每次完整同步)
+            min_interval: 快照轮询发现变化后的最短间隔(秒)，空闲时间隔逐次加倍直到interval
+            hub: 可选的WatchHub，多个自动同步任务共用一个观察者
+            settle_time: 监视模式下文件保持多少秒不变(写入完成)后才同步
+            warm_start: 是否保存同步状态(源/目标目录的stat快照)，下次启动时只同步其间的变化，
+                不再执行完整的初始同步；默认开启，所有监视和轮询方式在运行期间和停止时都会保存
+            state_file: 状态文件路径，默认为 ~/.huangyz_sync/state/ 下按源/目标目录命名的文件
+            state_interval: 运行期间保存状态的最小间隔(秒)，停止时也会保存
+            full_sync_interval: 快照轮询时完整同步的间隔(秒)，校正目标目录中被直接改动的文件
         """
         self.source_dir = os.path.abspath(source_dir)
         self.target_dir = os.path.abspath(target_dir)
         self.interval = interval
-        self.use_watchdog = use_watchdog and WATCHDOG_AVAILABLE
+        self.use_watchdog = use_watchdog and WATCH_AVAILABLE
         self.delete_extra = delete_extra
+        self.scheduler = scheduler
+        self.polling_mode = polling_mode
+        self.min_interval = min(min_interval, interval)
+        self.hub = hub
+        self.settle_time = settle_time
+        self.warm_start = warm_start
+        self.state_file = state_file or default_state_file(self.source_dir, self.target_dir)
+        self.state_interval = state_interval
+        self.full_sync_interval = full_sync_interval
+        self._last_save = 0
+        self._last_full_sync = time.monotonic()
         self.running = False
         self.watcher = None
         self._stop_flag = False
+        self._snapshot = None
+        # 最近一次同步中失败的路径，保存状态时记为未同步，下次启动时重试
+        self._failed = set()
         
         # 处理忽略规则
         if ignore_rules:
@@ -261,13 +381,43 @@ class AutoSync:
             return False
             
         try:
-            # 执行初始同步
-            print(f"执行初始同步: {self.source_dir} -> {self.target_dir}")
-            sync_directories(
-                self.source_dir, self.target_dir, 
-                delete_extra=self.delete_extra,
-                ignore_rules=self.ignore_rules
-            )
+            state = load_state(self.state_file, self.source_dir, self.target_dir) if self.warm_start else None
+            snapshot = None
+            if self.warm_start or (not self.use_watchdog and self.polling_mode == "snapshot"):
+                # 在初始同步之前记录快照，同步期间的变化会出现在下一次比较中
+                snapshot = take_snapshot(self.source_dir, self.ignore_rules)
+            
+            if state is not None:
+                # 只同步上次保存状态之后源目录和目标目录的变化
+                changes = state_changes(state, snapshot, take_snapshot(self.target_dir, self.ignore_rules))
+                print(f"从保存的状态启动，发现 {len(changes)} 项变化: {self.source_dir} -> {self.target_dir}")
+                result = {}
+                if changes:
+                    result = sync_paths(
+                        self.source_dir, self.target_dir, changes,
+                        delete_extra=self.delete_extra,
+                        ignore_rules=self.ignore_rules,
+                        scheduler=self.scheduler
+                    )
+            else:
+                # 执行初始同步
+                print(f"执行初始同步: {self.source_dir} -> {self.target_dir}")
+                result = sync_directories(
+                    self.source_dir, self.target_dir, 
+                    delete_extra=self.delete_extra,
+                    ignore_rules=self.ignore_rules,
+                    scheduler=self.scheduler
+                )
+            
+            if result is not None:
+                self._failed = set(result.get("failed", ()))
+            if self.warm_start and result is not None:
+                self._save_state(snapshot)
+            if not self.use_watchdog and (self.polling_mode == "snapshot" or result is not None):
+                # 快照轮询以它为比较基准(同步失败的路径不计入，下次轮询时重试)；
+                # 完整轮询时是最近一次成功同步前的快照，停止时据此保存状态
+                self._snapshot = advance_snapshot({}, snapshot, self._failed) \
+                    if self.polling_mode == "snapshot" and snapshot is not None else snapshot
             
             self.running = True
             self._stop_flag = False
@@ -279,7 +429,12 @@ class AutoSync:
                     self.target_dir,
                     sync_on_change=True,
                     auto_start=True,
-                    ignore_rules=self.ignore_rules
+                    ignore_rules=self.ignore_rules,
+                    scheduler=self.scheduler,
+                    hub=self.hub,
+                    settle_time=self.settle_time,
+                    checkpoint=self._checkpoint if self.warm_start else None,
+                    checkpoint_interval=self.state_interval
                 )
             else:
                 # 使用轮询方式定期同步
@@ -296,23 +451,106 @@ class AutoSync:
             self.running = False
             return False
     
+    def _save_state(self, source_snapshot, dirty=()):
+        """
+        保存与目标目录一致时的源目录快照，以及此时的目标目录快照
+
+        同步失败的路径与dirty一起记为未同步，快照中它们的状态不代表目标目录已一致
+        """
+        target_snapshot = take_snapshot(self.target_dir, self.ignore_rules)
+        if save_state(self.state_file, self.source_dir, self.target_dir,
+                      source_snapshot, target_snapshot, set(dirty) | self._failed):
+            self._last_save = time.monotonic()
+    
+    def _checkpoint(self, unsynced_paths):
+        """监视模式下由同步线程在空闲时调用"""
+        snapshot = take_snapshot(self.source_dir, self.ignore_rules)
+        # 扫描期间发生的变化在快照之后才会同步，记为未同步
+        self._save_state(snapshot, unsynced_paths())
+    
     def _polling_sync(self):
         """在后台线程中执行轮询同步"""
+        if self.polling_mode == "snapshot":
+            self._snapshot_polling()
+            return
+        
         while not self._stop_flag:
             try:
-                sync_directories(
+                snapshot = take_snapshot(self.source_dir, self.ignore_rules) if self.warm_start else None
+                result = sync_directories(
                     self.source_dir, self.target_dir, 
                     delete_extra=self.delete_extra,
-                    ignore_rules=self.ignore_rules
+                    ignore_rules=self.ignore_rules,
+                    scheduler=self.scheduler
                 )
+                if result is not None:
+                    self._failed = set(result.get("failed", ()))
+                if self.warm_start and result is not None:
+                    self._snapshot = snapshot
+                    if time.monotonic() - self._last_save >= self.state_interval:
+                        self._save_state(snapshot)
             except Exception as e:
                 print(f"轮询同步期间出错: {e}")
             
-            # 等待下一次同步，每秒检查一次停止标志
-            for _ in range(self.interval):
-                if self._stop_flag:
-                    break
-                time.sleep(1)
+            self._wait(self.interval)
+        if self.warm_start and self._snapshot is not None:
+            self._save_state(self._snapshot)
+    
+    def _snapshot_polling(self):
+        """
+        比较stat快照，只同步变化的路径；有变化时缩短间隔，空闲时逐次加倍
+
+        比较基准只对同步成功的路径前进，失败的路径在下一次轮询时重试；
+        每隔full_sync_interval执行一次完整同步，校正目标目录中被直接改动的文件
+        """
+        interval = self.min_interval
+        while not self._wait(interval):
+            try:
+                snapshot = take_snapshot(self.source_dir, self.ignore_rules)
+                if time.monotonic() - self._last_full_sync >= self.full_sync_interval:
+                    print(f"执行完整同步以校正目标目录: {self.source_dir} -> {self.target_dir}")
+                    self._last_full_sync = time.monotonic()
+                    changes = None
+                    result = sync_directories(
+                        self.source_dir, self.target_dir,
+                        delete_extra=self.delete_extra,
+                        ignore_rules=self.ignore_rules,
+                        scheduler=self.scheduler
+                    )
+                else:
+                    changes = diff_snapshots(self._snapshot, snapshot)
+                    result = {}
+                    if changes:
+                        print(f"轮询发现 {len(changes)} 项变化")
+                        result = sync_paths(
+                            self.source_dir, self.target_dir, changes,
+                            delete_extra=self.delete_extra,
+                            ignore_rules=self.ignore_rules,
+                            scheduler=self.scheduler
+                        )
+                if result is not None:
+                    self._failed = set(result.get("failed", ()))
+                    self._snapshot = advance_snapshot(self._snapshot, snapshot, self._failed)
+                if changes or result is None:
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * 2, self.interval)
+                if self.warm_start and time.monotonic() - self._last_save >= self.state_interval:
+                    self._save_state(self._snapshot)
+            except Exception as e:
+                print(f"轮询同步期间出错: {e}")
+        if self.warm_start:
+            self._save_state(self._snapshot)
+    
+    def _wait(self, seconds):
+        """等待下一次同步，每秒检查一次停止标志，返回是否已停止"""
+        deadline = time.monotonic() + seconds
+        while not self._stop_flag:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(1, remaining))
+        return self._stop_flag
     
     def stop(self):
         """停止自动同步"""
@@ -322,11 +560,18 @@ class AutoSync:
             
         try:
             if self.use_watchdog and self.watcher:
+                # 先记录快照再停止监视，停止前未同步的路径在下次启动时重新同步
+                snapshot = take_snapshot(self.source_dir, self.ignore_rules) if self.warm_start else None
                 self.watcher.stop()
+                if self.warm_start:
+                    self._save_state(snapshot, self.watcher.unsynced)
                 self.watcher = None
             else:
                 self._stop_flag = True
-                # 不需要join，因为是daemon线程
+                if self.warm_start:
+                    # 等待轮询线程保存状态
+                    self._thread.join()
+                # 否则不需要join，因为是daemon线程
             
             self.running = False
             print("自动同步已停止")
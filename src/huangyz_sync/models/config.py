@@ -4,9 +4,43 @@
 
 import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ..core.file_manager import FileManager
 from ..utils.ignore import IgnoreRules
+from ..utils.watch import WatchHub, WATCH_AVAILABLE
 from ..core.sync import sync_directories, AutoSync
+from ..core.repository import ChunkRepository
+from ..core.scheduler import SyncScheduler
+from ..core.shared import SharedSourceCache, overlapping_sources
+
+def _device_of(path):
+    """路径所在设备的st_dev，路径不存在时使用最近的已存在的上级目录"""
+    path = os.path.abspath(os.path.expanduser(path))
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+def _task_devices(task):
+    """任务的源目录和目标目录所在的设备(去重)"""
+    devices = set()
+    for key in ("source_dir", "target_dir"):
+        if task.get(key):
+            device = _device_of(task[key])
+            if device is not None:
+                devices.add(device)
+    return devices
+
+def _mirror_source(task):
+    """镜像任务规范化后的源目录，去重仓库任务和没有源目录的任务返回None"""
+    if not task.get("source_dir") or task.get("options", {}).get("backend", "mirror") == "repository":
+        return None
+    return os.path.normpath(os.path.abspath(task["source_dir"]))
 
 class SyncConfigManager:
     """管理同步配置，支持从配置文件加载和保存配置"""
@@ -208,16 +242,22 @@ class SyncConfigManager:
         
         return True
     
-    def run_tasks(self, task_indices_or_names=None):
+    def run_tasks(self, task_indices_or_names=None, jobs=1, jobs_per_device=1, share_scans=True):
         """
         执行指定的同步任务，如果未指定则执行所有已启用的任务
         
         参数:
             task_indices_or_names: 要执行的任务索引或名称列表，如果为None则执行所有已启用的任务
+            jobs: 同时执行的任务数上限，为1时依次执行
+            jobs_per_device: 同一个磁盘(源或目标目录所在设备的st_dev)上同时执行的任务数上限
+            share_scans: 源目录相同或相互包含的任务是否共用源目录的扫描和哈希结果
         
         返回:
             dict: 每个任务的执行结果
         """
+        # 小于1时没有任务能被调度，按1处理
+        jobs = max(1, jobs)
+        jobs_per_device = max(1, jobs_per_device)
         results = {}
         tasks_to_run = []
         
@@ -237,56 +277,161 @@ class SyncConfigManager:
                             tasks_to_run.append((i, task))
                             break
         
-        # 执行每个任务
-        for i, task in tasks_to_run:
-            task_name = task.get("name", f"Task_{i}")
-            print(f"\n执行同步任务: {task_name}")
-            
-            source_dir = task.get("source_dir")
-            target_dir = task.get("target_dir")
-            
-            if not source_dir or not os.path.exists(source_dir):
-                print(f"错误: 源目录不存在: {source_dir}")
-                results[task_name] = {"status": "error", "message": "源目录不存在"}
-                continue
-            
-            # 提取选项
-            options = task.get("options", {})
-            delete_extra = options.get("delete_extra", False)
-            compare_content = options.get("compare_content", True)
-            
-            # 处理忽略规则
-            ignore_config = task.get("ignore", {})
-            ignore_file = ignore_config.get("file")
-            ignore_patterns = ignore_config.get("patterns")
-            
-            ignore_rules = None
-            if ignore_file and os.path.exists(ignore_file):
-                ignore_rules = IgnoreRules(ignore_file=ignore_file)
-            elif ignore_patterns:
-                ignore_rules = IgnoreRules(patterns=ignore_patterns)
-            
-            # 执行同步
-            try:
+        # 源目录重叠的镜像任务共用一个缓存，每个任务仍按自己的忽略规则过滤
+        source_cache = None
+        shared_sources = set()
+        if share_scans:
+            shared_sources = overlapping_sources(
+                [source for source in (_mirror_source(task) for _, task in tasks_to_run) if source])
+            if shared_sources:
+                source_cache = SharedSourceCache(
+                    [source for source in (_mirror_source(task) for _, task in tasks_to_run)
+                     if source in shared_sources])
+        runs = [(i, task, source_cache if _mirror_source(task) in shared_sources else None)
+                for i, task in tasks_to_run]
+        if source_cache is not None:
+            print(f"{sum(1 for run in runs if run[2] is not None)} 个任务的源目录重叠，共用扫描和哈希结果")
+        
+        if jobs > 1 and len(runs) > 1:
+            task_results = self._run_concurrent(runs, jobs, jobs_per_device)
+        else:
+            # 依次执行每个任务
+            task_results = [self._run_task(*run) for run in runs]
+        
+        for task_name, result in task_results:
+            results[task_name] = result
+        
+        if source_cache is not None:
+            stats = source_cache.stats()
+            print(f"\n共享扫描和哈希: 目录列表复用 {stats['listing_hits']} 次(实际列出 {stats['listing_misses']} 次)，"
+                  f"文件哈希复用 {stats['hash_hits']} 次(实际计算 {stats['hash_misses']} 次)，"
+                  f"约节省 {stats['saved_seconds']:.2f} 秒")
+        return results
+    
+    def _run_concurrent(self, runs, jobs, jobs_per_device):
+        """
+        并发执行任务
+        
+        每次从等待的任务中按顺序选出第一个所用设备都有空闲名额的任务启动，
+        等待某个磁盘的任务不会占用其他磁盘上任务的名额。
+        
+        参数:
+            runs: (任务索引, 任务配置, 共享缓存) 列表
+        
+        返回:
+            list: 与runs顺序相同的 (任务名称, 结果)
+        """
+        devices = [_task_devices(run[1]) for run in runs]
+        print(f"并发执行 {len(runs)} 个任务，最多同时 {jobs} 个，每个磁盘最多 {jobs_per_device} 个")
+        
+        condition = threading.Condition()
+        busy = {}
+        running = [0]
+        
+        def finished(task_devices):
+            with condition:
+                running[0] -= 1
+                for device in task_devices:
+                    busy[device] -= 1
+                condition.notify()
+        
+        futures = [None] * len(runs)
+        waiting = list(range(len(runs)))
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            with condition:
+                while waiting:
+                    ready = None
+                    if running[0] < jobs:
+                        for position, index in enumerate(waiting):
+                            if all(busy.get(device, 0) < jobs_per_device for device in devices[index]):
+                                ready = waiting.pop(position)
+                                break
+                    if ready is None:
+                        condition.wait()
+                        continue
+                    running[0] += 1
+                    for device in devices[ready]:
+                        busy[device] = busy.get(device, 0) + 1
+                    futures[ready] = executor.submit(self._run_task, *runs[ready])
+                    futures[ready].add_done_callback(
+                        lambda future, task_devices=devices[ready]: finished(task_devices))
+        return [future.result() for future in futures]
+    
+    def _run_task(self, i, task, source_cache=None):
+        """
+        执行一个同步任务
+        
+        参数:
+            i: 任务索引
+            task: 任务配置
+            source_cache: 可选的SharedSourceCache，与源目录重叠的其他任务共用
+        
+        返回:
+            tuple: (任务名称, 执行结果)
+        """
+        task_name = task.get("name", f"Task_{i}")
+        print(f"\n执行同步任务: {task_name}")
+        
+        source_dir = task.get("source_dir")
+        target_dir = task.get("target_dir")
+        
+        if not source_dir or not os.path.exists(source_dir):
+            print(f"错误: 源目录不存在: {source_dir}")
+            return task_name, {"status": "error", "message": "源目录不存在"}
+        
+        # 提取选项
+        options = task.get("options", {})
+        delete_extra = options.get("delete_extra", False)
+        compare_content = options.get("compare_content", True)
+        
+        # 处理忽略规则
+        ignore_config = task.get("ignore", {})
+        ignore_file = ignore_config.get("file")
+        ignore_patterns = ignore_config.get("patterns")
+        nested_file = ignore_config.get("nested_file")
+        
+        ignore_rules = None
+        if ignore_file and os.path.exists(ignore_file):
+            ignore_rules = IgnoreRules(ignore_file=ignore_file, root_dir=source_dir, nested_file=nested_file)
+        elif ignore_patterns or nested_file:
+            ignore_rules = IgnoreRules(patterns=ignore_patterns, root_dir=source_dir, nested_file=nested_file)
+        
+        # 执行同步
+        try:
+            if options.get("backend", "mirror") == "repository":
+                # 去重仓库后端：目标目录作为块仓库，每次执行生成一个快照
+                repository = ChunkRepository(
+                    target_dir,
+                    compression=options.get("compression", "zlib")
+                )
+                operations = repository.backup(source_dir, ignore_rules=ignore_rules)
+            else:
                 operations = sync_directories(
-                    source_dir, target_dir, 
+                    source_dir, target_dir,
                     delete_extra=delete_extra,
                     compare_content=compare_content,
-                    ignore_rules=ignore_rules
+                    ignore_rules=ignore_rules,
+                    io_hints=options.get("io_hints"),
+                    scheduler=SyncScheduler.from_config(options.get("schedule")),
+                    scan_workers=options.get("scan_workers", 1),
+                    compare_workers=options.get("compare_workers", 1),
+                    transfer_workers=options.get("transfer_workers", 1),
+                    queue_size=options.get("queue_size", 1000),
+                    spill_threshold=options.get("spill_threshold"),
+                    spill_dir=options.get("spill_dir"),
+                    source_cache=source_cache
                 )
-                
-                results[task_name] = {
-                    "status": "success",
-                    "operations": operations
-                }
-            except Exception as e:
-                print(f"执行任务 {task_name} 时出错: {e}")
-                results[task_name] = {
-                    "status": "error",
-                    "message": str(e)
-                }
-        
-        return results
+            
+            return task_name, {
+                "status": "success",
+                "operations": operations
+            }
+        except Exception as e:
+            print(f"执行任务 {task_name} 时出错: {e}")
+            return task_name, {
+                "status": "error",
+                "message": str(e)
+            }
     
     def start_auto_sync(self, task_index_or_name, interval=60, use_watchdog=True):
         """
@@ -295,7 +440,7 @@ class SyncConfigManager:
         参数:
             task_index_or_name: 任务索引或名称
             interval: 同步间隔(秒)
-            use_watchdog: 是否使用watchdog监视文件变化
+            use_watchdog: 是否使用watchdog监视文件变化，所有任务共用一个观察者
         
         返回:
             AutoSync: 自动同步实例
@@ -328,17 +473,22 @@ class SyncConfigManager:
         # 提取选项
         options = task.get("options", {})
         delete_extra = options.get("delete_extra", False)
-        
+
+        if options.get("backend", "mirror") == "repository":
+            print(f"错误: 任务 {task.get('name')} 使用去重仓库后端，不支持自动同步")
+            return None
+
         # 处理忽略规则
         ignore_config = task.get("ignore", {})
         ignore_file = ignore_config.get("file")
         ignore_patterns = ignore_config.get("patterns")
+        nested_file = ignore_config.get("nested_file")
         
         ignore_rules = None
         if ignore_file and os.path.exists(ignore_file):
-            ignore_rules = IgnoreRules(ignore_file=ignore_file)
-        elif ignore_patterns:
-            ignore_rules = IgnoreRules(patterns=ignore_patterns)
+            ignore_rules = IgnoreRules(ignore_file=ignore_file, root_dir=source_dir, nested_file=nested_file)
+        elif ignore_patterns or nested_file:
+            ignore_rules = IgnoreRules(patterns=ignore_patterns, root_dir=source_dir, nested_file=nested_file)
         
         # 创建并启动自动同步实例
         try:
@@ -347,7 +497,13 @@ class SyncConfigManager:
                 interval=interval,
                 use_watchdog=use_watchdog,
                 delete_extra=delete_extra,
-                ignore_rules=ignore_rules
+                ignore_rules=ignore_rules,
+                scheduler=SyncScheduler.from_config(options.get("schedule")),
+                hub=WatchHub.shared() if use_watchdog and WATCH_AVAILABLE else None,
+                settle_time=options.get("settle_time", 2.0),
+                warm_start=options.get("warm_start", True),
+                full_sync_interval=options.get("full_sync_interval", 3600),
+                state_file=os.path.expanduser(options["state_file"]) if options.get("state_file") else None
             )
             
             auto_sync.start()
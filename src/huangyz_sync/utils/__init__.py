@@ -3,8 +3,8 @@
 """
 
 from .common import format_size, calculate_file_hash, WATCHDOG_AVAILABLE, PATHSPEC_AVAILABLE
-from .ignore import IgnoreRules
-from .watch import FolderWatcher
+from .ignore import IgnoreRules, IgnoreScope
+from .watch import FolderWatcher, WatchHub
 
 __all__ = [
     'format_size', 
@@ -12,5 +12,7 @@ __all__ = [
     'WATCHDOG_AVAILABLE', 
     'PATHSPEC_AVAILABLE',
     'IgnoreRules',
-    'FolderWatcher'
+    'IgnoreScope',
+    'FolderWatcher',
+    'WatchHub'
 ] 
\ No newline at end of file
@@ -3,9 +3,13 @@
 """
 
 import os
+import errno
 import hashlib
 import datetime
 
+# 处理稀疏文件空洞时复用的全零缓冲区
+ZERO_BLOCK = bytes(1024 * 1024)
+
 def format_size(size_bytes):
     """格式化文件大小"""
     if size_bytes < 1024:
@@ -17,18 +21,82 @@ def format_size(size_bytes):
     else:
         return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
 
+def is_sparse_file(file_stat):
+    """根据分配的块数判断文件是否含有空洞"""
+    blocks = getattr(file_stat, "st_blocks", None)
+    return blocks is not None and blocks * 512 < file_stat.st_size
+
+def iter_data_extents(fd, size):
+    """
+    使用SEEK_DATA/SEEK_HOLE遍历文件中的数据区段
+    
+    参数:
+        fd: 已打开文件的描述符
+        size: 文件的逻辑大小
+    
+    返回:
+        生成器，逐个产生 (起始偏移, 结束偏移)；平台或文件系统不支持时整个文件作为一个区段
+    """
+    if not hasattr(os, "SEEK_DATA"):
+        if size:
+            yield 0, size
+        return
+    
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # 之后只剩空洞
+                return
+            # 文件系统不支持，退化为整段读取
+            yield offset, size
+            return
+        if start >= size:
+            return
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        yield start, end
+        offset = end
+
 def calculate_file_hash(file_path):
     """计算文件的MD5哈希值以比较文件内容"""
     try:
         hash_md5 = hashlib.md5()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
+            file_stat = os.fstat(f.fileno())
+            if is_sparse_file(file_stat):
+                # 稀疏文件只读取数据区段，空洞部分直接以零填充哈希，不产生磁盘读取
+                position = 0
+                for start, end in iter_data_extents(f.fileno(), file_stat.st_size):
+                    _update_zeros(hash_md5, start - position)
+                    f.seek(start)
+                    remaining = end - start
+                    while remaining > 0:
+                        chunk = f.read(min(remaining, len(ZERO_BLOCK)))
+                        if not chunk:
+                            # 文件在读取过程中被截断，哈希值已不可靠
+                            print(f"计算文件哈希值时出错: 文件在读取过程中被截断: {file_path}")
+                            return None
+                        hash_md5.update(chunk)
+                        remaining -= len(chunk)
+                    position = end
+                _update_zeros(hash_md5, file_stat.st_size - position)
+            else:
+                for chunk in iter(lambda: f.read(4096), b""):
+                    hash_md5.update(chunk)
         return hash_md5.hexdigest()
     except Exception as e:
         print(f"计算文件哈希值时出错: {e}")
         return None
 
+def _update_zeros(hash_obj, length):
+    """向哈希对象追加指定长度的零字节"""
+    while length > 0:
+        step = min(length, len(ZERO_BLOCK))
+        hash_obj.update(memoryview(ZERO_BLOCK)[:step])
+        length -= step
+
 def check_dependencies():
     """检查可选依赖并返回可用状态"""
     results = {}
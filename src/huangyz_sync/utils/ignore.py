@@ -4,26 +4,206 @@
 
 import os
 import re
+import sys
 import fnmatch
+import threading
+from collections import OrderedDict
 
 from .common import PATHSPEC_AVAILABLE
 
 if PATHSPEC_AVAILABLE:
     import pathspec
 
+# 合并匹配器中每个分块包含的规则数量
+MATCHER_BLOCK_SIZE = 32
+
+def _alternation(sources):
+    """把多个正则表达式源码合并为一个非捕获分组的交替正则"""
+    return re.compile("|".join(f"(?:{source})" for source in sources))
+
+class _CombinedMatcher:
+    """
+    把多条规则合并为交替正则，按"最后匹配生效"找出决定结果的规则
+    
+    不带捕获分组的交替正则可以被re提取公共前缀，比逐条匹配快得多，
+    所以先用一个合并全部规则的正则判断是否有规则匹配(绝大多数路径不匹配)；
+    命中时再从序号最大的分块开始，用分块的合并正则定位，最后只在一个分块内逐条确认。
+    """
+    
+    def __init__(self, items):
+        """
+        参数:
+            items: 按序号升序排列的 (规则序号, 已编译正则) 列表
+        """
+        self._any = _alternation(c.pattern for _, c in items) if items else None
+        self._blocks = []
+        for start in range(0, len(items), MATCHER_BLOCK_SIZE):
+            block = items[start:start + MATCHER_BLOCK_SIZE]
+            self._blocks.append((_alternation(c.pattern for _, c in block), block[::-1]))
+        self._blocks.reverse()
+    
+    def last_match(self, path):
+        """返回匹配path的最大规则序号，没有匹配时返回-1"""
+        if self._any is None or not self._any.match(path):
+            return -1
+        for block_regex, block in self._blocks:
+            if block_regex.match(path):
+                for index, compiled in block:
+                    if compiled.match(path):
+                        return index
+        return -1
+
+# 通配符字符，不含这些字符的规则按字面量处理
+_WILDCARD_CHARS = "*?["
+
+def _literal_prefix(pattern):
+    """返回规则中第一个通配符之前的字面量部分"""
+    for i, char in enumerate(pattern):
+        if char in _WILDCARD_CHARS:
+            return pattern[:i]
+    return pattern
+
+def _pathspec_literal_prefix(pattern):
+    """
+    返回Git风格规则只能匹配的路径前缀
+    
+    不含中间斜杠的规则可以匹配任意层级的路径，返回None
+    """
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    elif '/' not in pattern.rstrip('/') or pattern.startswith('**'):
+        return None
+    for i, char in enumerate(pattern):
+        if char in _WILDCARD_CHARS or char == '\\':
+            return pattern[:i]
+    return pattern
+
+class IgnoreScope:
+    """
+    忽略规则在某个目录下的作用范围，由IgnoreRules.scope_for返回
+    
+    mode为 NONE 时目录下没有规则可能匹配，ALL 时目录下所有路径都被忽略，
+    PARTIAL 时只有 rules 中的规则可能匹配。
+    """
+    
+    NONE = "none"
+    ALL = "all"
+    PARTIAL = "partial"
+    
+    def __init__(self, mode, rules=None):
+        self.mode = mode
+        self.rules = rules
+    
+    def should_ignore(self, path, is_dir=False):
+        """检查该目录下的路径(相对于规则根目录)是否应该被忽略"""
+        if self.mode == IgnoreScope.NONE:
+            return False
+        if self.mode == IgnoreScope.ALL:
+            return True
+        return self.rules.should_ignore(path, is_dir)
+    
+    def __repr__(self):
+        return f"IgnoreScope({self.mode})"
+
+class _PatternIndex:
+    """
+    按规则类型建立的索引，大部分规则通过哈希查找而不是正则匹配
+    
+    规则分为四类：
+        精确路径: 不含通配符的规则，整个相对路径相等才匹配，用字典查找
+        扩展名:   形如 *.tmp 的规则，用路径最后一个点之后的部分查字典
+        前缀树:   字面量前缀中包含目录的规则(如 logs/*.log)，只对前缀目录下的路径匹配正则
+        其余规则: 合并为一个_CombinedMatcher
+    每类都只记录匹配到的最大规则序号，由调用方比较各类结果，保持"最后匹配生效"。
+    """
+    
+    def __init__(self, items):
+        """
+        参数:
+            items: 按序号升序排列的 (规则序号, 规则文本, 已编译正则) 列表
+        """
+        self._exact = {}
+        self._extensions = {}
+        self._trie = {}
+        residual = []
+        for index, pattern, compiled in items:
+            prefix = _literal_prefix(pattern)
+            if prefix == pattern:
+                self._exact[pattern] = index
+            elif (pattern.startswith("*.") and len(pattern) > 2
+                  and not any(c in pattern[2:] for c in _WILDCARD_CHARS + "/.")):
+                self._extensions[pattern[2:]] = index
+            elif "/" in prefix:
+                node = self._trie
+                for segment in prefix[:prefix.rfind("/")].split("/"):
+                    node = node.setdefault(segment, {})
+                node.setdefault(None, []).append((index, compiled))
+            else:
+                residual.append((index, compiled))
+        self._residual = _CombinedMatcher(residual)
+        self._compile_trie(self._trie)
+    
+    def _compile_trie(self, node):
+        """把前缀树节点上的规则列表替换为合并匹配器"""
+        for key, child in node.items():
+            if key is None:
+                node[None] = _CombinedMatcher(child)
+            else:
+                self._compile_trie(child)
+    
+    def last_match(self, path):
+        """返回匹配path的最大规则序号，没有匹配时返回-1"""
+        index = self._exact.get(path, -1)
+        
+        if self._extensions:
+            dot = path.rfind(".")
+            if dot >= 0:
+                index = max(index, self._extensions.get(path[dot + 1:], -1))
+        
+        if self._trie:
+            node = self._trie
+            # 前缀树中的规则要求路径以其前缀目录开头，所以只沿目录部分向下查找
+            for segment in path.split("/")[:-1]:
+                node = node.get(segment)
+                if node is None:
+                    break
+                matcher = node.get(None)
+                if matcher is not None:
+                    index = max(index, matcher.last_match(path))
+        
+        return max(index, self._residual.last_match(path))
+
 class IgnoreRules:
     """管理忽略规则，类似于.gitignore功能"""
     
-    def __init__(self, ignore_file=None, patterns=None):
+    def __init__(self, ignore_file=None, patterns=None, root_dir=None, nested_file=None, cache_size=4096):
         """
         初始化忽略规则
         
         参数:
             ignore_file: 包含忽略规则的文件路径（类似.gitignore）
             patterns: 忽略规则列表
+            root_dir: 规则根目录(源目录)，启用嵌套忽略文件时需要
+            nested_file: 嵌套忽略文件名(如 .syncignore)，任意目录中的该文件作用于其子树，
+                         优先级高于上层目录的文件和基础规则
+            cache_size: should_ignore结果的LRU缓存容量，0表示不缓存
         """
         self.patterns = patterns or []
         self._spec = None
+        self.root_dir = os.path.abspath(root_dir) if root_dir else None
+        self.nested_file = nested_file if root_dir else None
+        self._nested_specs = {}
+        self._nested_chains = {}
+        # 作用范围和嵌套规则缓存由并行扫描的多个线程共用；只在读写字典时持有锁，
+        # 计算在锁外进行，两个线程同时计算同一目录时结果相同，以先写入的为准
+        self._scope_lock = threading.Lock()
+        
+        # should_ignore的结果缓存，键为 (规范化后的相对路径, 是否目录)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
         
         # 如果提供了忽略文件，从文件加载规则
         if ignore_file and os.path.exists(ignore_file):
@@ -54,6 +234,11 @@ class IgnoreRules:
     
     def _compile_patterns(self):
         """编译忽略规则"""
+        # 规则变化后各目录的作用范围和缓存的结果都需要重新计算
+        with self._scope_lock:
+            self._scope_cache = {}
+            self._nested_chains = {}
+        self.clear_cache()
         if PATHSPEC_AVAILABLE:
             # 使用pathspec库，能更好地支持Git风格的规则
             self._spec = pathspec.PathSpec.from_lines(
@@ -81,6 +266,12 @@ class IgnoreRules:
                     'is_negation': is_negation,
                     'is_directory': is_directory
                 })
+            
+            # 按规则类型建立索引：普通形式匹配全部规则，带斜杠形式只匹配目录规则
+            items = [(i, info['pattern'], info['compiled']) for i, info in enumerate(self._compiled_patterns)]
+            self._file_matcher = _PatternIndex(items)
+            self._dir_matcher = _PatternIndex([item for item in items
+                                               if self._compiled_patterns[item[0]]['is_directory']])
     
     def should_ignore(self, path, is_dir=False):
         """
@@ -93,6 +284,33 @@ class IgnoreRules:
         返回:
             bool: 如果应该忽略返回True，否则返回False
         """
+        path = self._normalize(path)
+        if not self.cache_size:
+            return self._evaluate(path, is_dir)
+        
+        if self.nested_file:
+            # 先确认本轮已检查过路径所在目录的嵌套忽略文件，文件有变化时会清空结果缓存
+            self._nested_chain(path.rpartition('/')[0])
+        
+        key = (path, is_dir)
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return result
+            self._cache_misses += 1
+        
+        result = self._evaluate(path, is_dir)
+        with self._cache_lock:
+            self._cache[(sys.intern(path), is_dir)] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+    
+    @staticmethod
+    def _normalize(path):
+        """把路径规范化为匹配使用的形式"""
         # 对路径进行规范化
         path = path.replace('\\', '/')
         
@@ -101,7 +319,49 @@ class IgnoreRules:
         if os.path.isabs(path):
             # 如果给定的是绝对路径，需要转换成适合匹配的形式
             path = os.path.basename(path)
+        return path
+    
+    def _evaluate(self, path, is_dir):
+        """对规范化后的路径执行匹配"""
+        if self.nested_file:
+            # 从最深的嵌套忽略文件开始，第一个有规则匹配的文件决定结果，都没有匹配时使用基础规则
+            for base, rules in self._nested_chain(path.rpartition('/')[0]):
+                result = rules._match(path[len(base):], is_dir)
+                if result is not None:
+                    return result
+        
+        if PATHSPEC_AVAILABLE:
+            # 使用pathspec库检查，对目录尝试两种形式
+            return bool(self._spec.match_file(path) or (is_dir and self._spec.match_file(path + '/')))
+        return bool(self._match(path, is_dir))
+    
+    def clear_cache(self):
+        """清空should_ignore的结果缓存"""
+        with self._cache_lock:
+            self._cache.clear()
+    
+    def cache_info(self):
+        """
+        返回结果缓存的统计信息
+        
+        返回:
+            dict: hits(命中次数)、misses(未命中次数)、size(当前条目数)、maxsize(容量)
+        """
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "size": len(self._cache),
+                "maxsize": self.cache_size
+            }
+    
+    def _match(self, path, is_dir):
+        """
+        用本对象的规则匹配已规范化的路径
         
+        返回:
+            True表示忽略，False表示被否定规则排除，None表示没有规则匹配
+        """
         # 如果是目录，在路径末尾添加/以匹配目录模式
         if is_dir and not path.endswith('/'):
             path_with_slash = path + '/'
@@ -109,30 +369,206 @@ class IgnoreRules:
             path_with_slash = path
         
         if PATHSPEC_AVAILABLE:
-            # 使用pathspec库检查，对目录尝试两种形式
-            return self._spec.match_file(path) or (is_dir and self._spec.match_file(path_with_slash))
+            # 与match_file一致，对两种形式分别取最后匹配的规则
+            result = None
+            for candidate in ((path, path_with_slash) if is_dir else (path,)):
+                for pattern in reversed(self._spec.patterns):
+                    if pattern.include is not None and pattern.regex.match(candidate):
+                        if pattern.include:
+                            return True
+                        result = False
+                        break
+            return result
         else:
-            # 使用自己的简单实现
-            result = False
+            # 先查哈希索引，只有其余规则才需要正则匹配，最后匹配的规则决定结果
+            index = self._file_matcher.last_match(path)
+            if is_dir:
+                index = max(index, self._dir_matcher.last_match(path_with_slash))
+            if index < 0:
+                return None
+            return not self._compiled_patterns[index]['is_negation']
+    
+    def refresh(self):
+        """
+        开始新一轮同步前调用：嵌套忽略文件在下次用到时重新检查修改时间，
+        只有修改过的文件才会重新解析；should_ignore的结果缓存只在某个嵌套忽略文件
+        新增、修改或删除时清空，规则没有变化时跨轮次保留
+        """
+        with self._scope_lock:
+            self._nested_chains = {}
+            self._scope_cache = {}
+    
+    def _nested_rules(self, dir_rel_path):
+        """
+        返回目录中嵌套忽略文件编译后的规则，按文件修改时间缓存
+
+        没有忽略文件的目录也记录下来(修改时间为None)，之后文件新增、修改或删除时
+        清空should_ignore的结果缓存
+        """
+        ignore_file = os.path.join(self.root_dir, dir_rel_path, self.nested_file)
+        try:
+            mtime = os.stat(ignore_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        with self._scope_lock:
+            cached = self._nested_specs.get(dir_rel_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        rules = None
+        if mtime is not None:
+            try:
+                with open(ignore_file, 'r', encoding='utf-8') as f:
+                    patterns = [line.strip() for line in f]
+                rules = IgnoreRules(patterns=[line for line in patterns if line and not line.startswith('#')],
+                                    cache_size=0)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"加载忽略规则时出错: {e}")
+        with self._scope_lock:
+            self._nested_specs[dir_rel_path] = (mtime, rules)
+        if cached is not None:
+            # 第一次检查时还没有依赖它的缓存结果，只有变化时才需要清空
+            self.clear_cache()
+        return rules
+    
+    def _nested_chain(self, dir_rel_path):
+        """
+        返回对目录中的路径生效的嵌套规则，按从深到浅排列的 (目录前缀, 规则) 元组
+        
+        每个目录的结果在一轮同步内缓存，由父目录的结果加上本目录的忽略文件得到
+        """
+        with self._scope_lock:
+            chain = self._nested_chains.get(dir_rel_path)
+        if chain is None:
+            chain = self._nested_chain(dir_rel_path.rpartition('/')[0]) if dir_rel_path else ()
+            rules = self._nested_rules(dir_rel_path)
+            if rules is not None and rules.patterns:
+                chain = ((dir_rel_path + '/' if dir_rel_path else '', rules),) + chain
+            with self._scope_lock:
+                chain = self._nested_chains.setdefault(dir_rel_path, chain)
+        return chain
+    
+    def scope_for(self, dir_rel_path):
+        """
+        分析规则在某个目录下的作用范围，结果按目录缓存
+        
+        规则只能匹配以其字面量前缀开头的路径，与目录前缀不相容的规则在该目录下不会生效。
+        遍历大目录时先取一次作用范围，就可以跳过逐个文件的检查或只检查少量规则。
+        
+        参数:
+            dir_rel_path: 目录相对于规则根目录的路径，'.'或空字符串表示根目录
+        
+        返回:
+            IgnoreScope: 目录下路径的忽略范围
+        """
+        dir_rel_path = dir_rel_path.replace('\\', '/').strip('/')
+        if dir_rel_path == '.':
+            dir_rel_path = ''
+        with self._scope_lock:
+            scope = self._scope_cache.get(dir_rel_path)
+        if scope is None:
+            scope = self._analyze_scope(dir_rel_path + '/' if dir_rel_path else '')
+            if self.nested_file:
+                scope = self._compose_nested_scope(dir_rel_path, scope)
+            with self._scope_lock:
+                scope = self._scope_cache.setdefault(dir_rel_path, scope)
+        return scope
+    
+    def filter_entries(self, dir_rel_path, entries, ignored=None):
+        """
+        一次过滤一个目录中的全部条目
+        
+        目录的作用范围和路径前缀只计算一次，作用范围为NONE或ALL时不再逐个匹配。
+        
+        参数:
+            dir_rel_path: 目录相对于规则根目录的路径，'.'或空字符串表示根目录
+            entries: os.DirEntry 对象或 (名称, 是否目录) 元组的可迭代对象
+            ignored: 可选列表，用于收集被忽略的条目(原样加入)
+        
+        返回:
+            list: 未被忽略的条目，保持原来的顺序
+        """
+        scope = self.scope_for(dir_rel_path)
+        if scope.mode == IgnoreScope.NONE:
+            return list(entries)
+        if scope.mode == IgnoreScope.ALL:
+            if ignored is None:
+                return []
+            ignored.extend(entries)
+            return []
+        
+        dir_rel_path = dir_rel_path.replace('\\', '/').strip('/')
+        prefix = dir_rel_path + '/' if dir_rel_path and dir_rel_path != '.' else ''
+        rules = scope.rules
+        kept = []
+        for entry in entries:
+            if isinstance(entry, tuple):
+                name, is_dir = entry
+            else:
+                name = entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+            if rules.should_ignore(prefix + name, is_dir):
+                if ignored is not None:
+                    ignored.append(entry)
+            else:
+                kept.append(entry)
+        return kept
+    
+    def _compose_nested_scope(self, dir_rel_path, scope):
+        """
+        合并嵌套忽略文件的作用范围
+        
+        更深的目录可能有自己的忽略文件，启用嵌套忽略文件时作用范围只对目录中的直接条目有效
+        """
+        chain = self._nested_chain(dir_rel_path)
+        if not chain:
+            return scope
+        dir_prefix = dir_rel_path + '/' if dir_rel_path else ''
+        if scope.mode == IgnoreScope.NONE and all(
+                rules.scope_for(dir_prefix[len(base):]).mode == IgnoreScope.NONE for base, rules in chain):
+            return scope
+        return IgnoreScope(IgnoreScope.PARTIAL, self)
+    
+    def _analyze_scope(self, prefix):
+        """找出可能匹配prefix下路径的规则"""
+        candidates = []
+        has_ignore = False
+        # 最后一条忽略全部子路径的规则之后如果没有可能生效的否定规则，整个目录都被忽略
+        catch_all = False
+        for pattern in self.patterns:
+            is_negation = pattern.startswith('!')
+            body = pattern[1:] if is_negation else pattern
             
-            for pattern_info in self._compiled_patterns:
-                # 检查是否匹配（标准形式）
-                if pattern_info['compiled'].match(path):
-                    # 取反规则
-                    if pattern_info['is_negation']:
-                        result = False
-                    else:
-                        result = True
-                    continue
-                
-                # 对目录尝试带斜杠的形式
-                if is_dir and pattern_info['is_directory'] and pattern_info['compiled'].match(path_with_slash):
-                    if pattern_info['is_negation']:
-                        result = False
-                    else:
-                        result = True
+            if PATHSPEC_AVAILABLE:
+                literal = _pathspec_literal_prefix(body)
+            else:
+                if body.endswith('/'):
+                    body = body[:-1]
+                literal = _literal_prefix(body)
             
-            return result
+            if literal is not None and not (literal.startswith(prefix) or prefix.startswith(literal)):
+                continue
+            
+            candidates.append(pattern)
+            if is_negation:
+                catch_all = False
+            else:
+                has_ignore = True
+                if not PATHSPEC_AVAILABLE and body == literal + '*' and prefix.startswith(literal):
+                    catch_all = True
+        
+        if not has_ignore:
+            return IgnoreScope(IgnoreScope.NONE)
+        if catch_all:
+            return IgnoreScope(IgnoreScope.ALL)
+        if len(candidates) == len(self.patterns):
+            return IgnoreScope(IgnoreScope.PARTIAL, self)
+        # 最终结果由本对象缓存，精简后的规则不再单独缓存
+        return IgnoreScope(IgnoreScope.PARTIAL, IgnoreRules(patterns=candidates, cache_size=0))
     
     def add_pattern(self, pattern):
         """添加一个忽略规则"""
@@ -0,0 +1,346 @@
+"""
+Linux inotify文件监视后端，通过ctypes直接调用libc，不依赖watchdog
+
+接口与 watchdog.observers.Observer 相同(schedule/start/stop/join)，
+所有监视共用一个inotify实例，由一个epoll线程批量读取事件。
+"""
+
+import os
+import sys
+import errno
+import struct
+import select
+import threading
+
+INOTIFY_AVAILABLE = False
+if sys.platform.startswith('linux'):
+    try:
+        import ctypes
+        import ctypes.util
+
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        INOTIFY_AVAILABLE = hasattr(select, 'epoll')
+    except (OSError, AttributeError):
+        INOTIFY_AVAILABLE = False
+
+# inotify事件掩码，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+# 内核将这两个标志定义为对应的open标志，其值因架构而异
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+_EVENT_HEADER = struct.Struct('iIII')
+# 每次从inotify描述符读取的字节数
+READ_SIZE = 256 * 1024
+
+class InotifyEvent:
+    """与watchdog事件对象属性相同的文件系统事件"""
+
+    __slots__ = ('event_type', 'src_path', 'dest_path', 'is_directory', 'is_synthetic')
+
+    def __init__(self, event_type, src_path, is_directory=False, dest_path='', is_synthetic=False):
+        self.event_type = event_type
+        self.src_path = src_path
+        self.dest_path = dest_path
+        self.is_directory = is_directory
+        self.is_synthetic = is_synthetic
+
+    def __repr__(self):
+        return f"InotifyEvent({self.event_type}, {self.src_path!r})"
+
+class InotifyObserver:
+    """
+    基于inotify的观察者
+
+    递归监视时为每个子目录添加一个watch，新建或移入的目录自动加入监视。
+    内核事件队列溢出(IN_Q_OVERFLOW)时，向每个监视根目录发送 'overflow' 事件，
+    由处理器对该目录重新扫描；新目录因监视数量达到上限而无法监视时，只对该目录发送。
+    """
+
+    def __init__(self):
+        self._schedules = []
+        self._wd_paths = {}
+        self._path_wds = {}
+        self._lock = threading.Lock()
+        self._fd = None
+        self._epoll = None
+        self._wake_r = self._wake_w = None
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, event_handler, path, recursive=False):
+        """
+        监视一个目录，事件交给 event_handler.dispatch(event) 处理
+
+        参数:
+            event_handler: 有dispatch方法的事件处理器
+            path: 要监视的目录
+            recursive: 是否监视所有子目录
+
+        返回:
+            可传给unschedule的监视对象
+        """
+        path = os.path.abspath(path)
+        watch = (event_handler, path, recursive)
+        with self._lock:
+            self._schedules.append(watch)
+            if self._fd is not None:
+                self._add_watches(path, recursive)
+        return watch
+
+    def unschedule(self, watch):
+        """取消schedule返回的监视，不再被其他监视覆盖的目录watch随之移除"""
+        with self._lock:
+            if watch not in self._schedules:
+                return
+            self._schedules.remove(watch)
+            if self._fd is None:
+                return
+            _, path, _ = watch
+            prefix = os.path.join(path, '')
+            for current in [p for p in self._path_wds if p == path or p.startswith(prefix)]:
+                if not self._is_covered(current):
+                    wd = self._path_wds.pop(current)
+                    self._wd_paths.pop(wd, None)
+                    _libc.inotify_rm_watch(self._fd, wd)
+
+    def start(self):
+        """创建inotify实例并启动事件线程"""
+        if not INOTIFY_AVAILABLE:
+            raise OSError("当前系统不支持inotify")
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._epoll = select.epoll()
+        self._epoll.register(self._fd, select.EPOLLIN)
+        self._epoll.register(self._wake_r, select.EPOLLIN)
+        with self._lock:
+            for _, path, recursive in self._schedules:
+                self._add_watches(path, recursive)
+        self._thread = threading.Thread(target=self._run, name="huangyz-inotify", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """通知事件线程退出"""
+        self._stopped = True
+        if self._wake_w is not None:
+            os.write(self._wake_w, b'x')
+
+    def join(self, timeout=None):
+        """等待事件线程退出并释放资源"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+            self._thread = None
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        if self._epoll is not None:
+            self._epoll.close()
+        self._fd = self._wake_r = self._wake_w = self._epoll = None
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _add_watches(self, path, recursive):
+        """
+        为目录(递归时包括全部子目录)添加watch
+        
+        返回:
+            list: 因监视数量达到上限而未能监视的目录
+        """
+        missed = []
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    print(f"inotify监视数量已达上限(fs.inotify.max_user_watches)，未能监视: {current}")
+                    missed.append(current)
+                elif err not in (errno.ENOENT, errno.ENOTDIR):
+                    print(f"添加inotify监视时出错: {current}: {os.strerror(err)}")
+                continue
+            self._wd_paths[wd] = current
+            self._path_wds[current] = wd
+            if not recursive:
+                continue
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                pass
+        return missed
+
+    def _remove_watches(self, path):
+        """移除目录及其子目录的watch(目录被移出监视范围时使用)"""
+        prefix = os.path.join(path, '')
+        for current in [p for p in self._path_wds if p == path or p.startswith(prefix)]:
+            wd = self._path_wds.pop(current)
+            self._wd_paths.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def _rename_watches(self, old_path, new_path):
+        """目录在监视范围内移动后，更新其子目录watch对应的路径"""
+        prefix = os.path.join(old_path, '')
+        for current in [p for p in self._path_wds if p == old_path or p.startswith(prefix)]:
+            wd = self._path_wds.pop(current)
+            renamed = new_path + current[len(old_path):]
+            self._path_wds[renamed] = wd
+            self._wd_paths[wd] = renamed
+
+    def _is_covered(self, path):
+        """检查目录是否仍在某个监视范围内"""
+        for _, root, recursive in self._schedules:
+            if path == root or (recursive and path.startswith(os.path.join(root, ''))):
+                return True
+        return False
+
+    def _is_recursive(self, path):
+        for _, root, recursive in self._schedules:
+            if recursive and (path == root or path.startswith(os.path.join(root, ''))):
+                return True
+        return False
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                ready = self._epoll.poll()
+            except InterruptedError:
+                continue
+            for fd, _ in ready:
+                if fd == self._wake_r:
+                    continue
+                data = self._read_all()
+                if data:
+                    with self._lock:
+                        events = self._parse(data)
+                    self._dispatch(events)
+
+    def _read_all(self):
+        """一次读出当前所有可读的事件数据"""
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self._fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                print(f"读取inotify事件时出错: {e}")
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _parse(self, data):
+        """把一批原始事件转换为InotifyEvent列表，配对移动事件"""
+        events = []
+        moved_from = {}
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件已丢失，无法确定范围，由处理器重新扫描各监视根目录
+                for _, root, _ in self._schedules:
+                    events.append(InotifyEvent('overflow', root, True))
+                continue
+            if mask & IN_IGNORED:
+                path = self._wd_paths.pop(wd, None)
+                if path is not None and self._path_wds.get(path) == wd:
+                    del self._path_wds[path]
+                continue
+
+            directory = self._wd_paths.get(wd)
+            if directory is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue
+            path = os.path.join(directory, name) if name else directory
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                # 占位，等待同一cookie的IN_MOVED_TO
+                slot = len(events)
+                events.append(None)
+                moved_from[cookie] = (slot, path, is_dir)
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                if source is not None:
+                    slot, src_path, _ = source
+                    events[slot] = InotifyEvent('moved', src_path, is_dir, dest_path=path)
+                    if is_dir:
+                        self._rename_watches(src_path, path)
+                else:
+                    # 从监视范围外移入
+                    events.append(InotifyEvent('created', path, is_dir))
+                    if is_dir and self._is_recursive(path):
+                        self._watch_new_dir(path, events)
+            elif mask & IN_CREATE:
+                events.append(InotifyEvent('created', path, is_dir))
+                if is_dir and self._is_recursive(path):
+                    self._watch_new_dir(path, events)
+            elif mask & IN_DELETE:
+                events.append(InotifyEvent('deleted', path, is_dir))
+            elif mask & IN_CLOSE_WRITE:
+                events.append(InotifyEvent('closed', path, is_dir))
+            elif mask & (IN_MODIFY | IN_ATTRIB):
+                events.append(InotifyEvent('modified', path, is_dir))
+
+        # 没有配对的IN_MOVED_FROM表示移出了监视范围
+        for slot, path, is_dir in moved_from.values():
+            events[slot] = InotifyEvent('deleted', path, is_dir)
+            if is_dir:
+                self._remove_watches(path)
+        return [event for event in events if event is not None]
+
+    def _watch_new_dir(self, path, events):
+        """
+        监视新出现的目录；未能监视的目录(包括新目录本身)之后的变化会丢失，
+        发送 'overflow' 事件使其被重新扫描
+        """
+        for missed in self._add_watches(path, True):
+            events.append(InotifyEvent('overflow', missed, True))
+
+    def _dispatch(self, events):
+        for event in events:
+            for handler, root, recursive in list(self._schedules):
+                path = event.src_path
+                if path != root and not path.startswith(os.path.join(root, '')):
+                    continue
+                if not recursive and os.path.dirname(path) != root and path != root:
+                    continue
+                try:
+                    handler.dispatch(event)
+                except Exception as e:
+                    print(f"处理文件变化事件时出错: {e}")
@@ -3,20 +3,651 @@
 """
 
 import os
+import stat
 import time
+import queue
+import threading
 
 from .common import WATCHDOG_AVAILABLE
 from .ignore import IgnoreRules
+from .inotify import INOTIFY_AVAILABLE, InotifyObserver, InotifyEvent
 
 if WATCHDOG_AVAILABLE:
     from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler
+
+# 可用的文件监视后端
+WATCH_AVAILABLE = WATCHDOG_AVAILABLE or INOTIFY_AVAILABLE
+
+# 检查观察者线程是否仍在运行的间隔(秒)
+OBSERVER_CHECK_INTERVAL = 5
+# 变化过多时合并成的子目录数量上限
+MAX_RESCAN_SUBTREES = 100
+
+def observer_alive(observer):
+    """观察者及其事件线程(watchdog的emitter)是否都在运行"""
+    if observer is None or not observer.is_alive():
+        return False
+    return all(emitter.is_alive() for emitter in getattr(observer, 'emitters', ()))
+
+def collapse_changes(changes, limit=MAX_RESCAN_SUBTREES):
+    """
+    把大量变化合并为不超过limit个需要重新扫描的子目录
+    
+    取每个变化所在的目录，逐层向上合并最深的目录直到数量不超过limit，
+    再去掉已包含在其他目录中的目录。
+    
+    返回:
+        list: 每个子目录一条 'modified' 变化记录，同步时会扫描整个子目录
+    """
+    dirs = set()
+    for kind, rel_path, dest_rel_path in changes:
+        for path in (rel_path, dest_rel_path):
+            if path:
+                parent = os.path.dirname(path)
+                dirs.add(tuple(parent.split(os.sep)) if parent else ())
+    
+    depth = max((len(parts) for parts in dirs), default=0)
+    while len(dirs) > limit and depth > 0:
+        depth -= 1
+        dirs = set(parts[:depth] for parts in dirs)
+    
+    result = []
+    for parts in sorted(dirs, key=len):
+        if not any(parts[:len(kept)] == kept for kept in result):
+            result.append(parts)
+    return [('modified', os.path.join(*parts) if parts else '.', None) for parts in result]
+
+def _within(path, dirs):
+    """path是否是dirs中某个目录本身或其下的路径"""
+    if '.' in dirs:
+        return True
+    while path:
+        if path in dirs:
+            return True
+        path = os.path.dirname(path)
+    return False
+
+class ChangeCoalescer:
+    """
+    合并一段时间内的文件变化
+    
+    同一路径的多次变化只保留最后一条；最后一个事件之后安静 quiet_period 秒，
+    或者距本批第一个事件已过 max_latency 秒(持续写入时也定期交出)，本批变化即可交出。
+    """
+    
+    def __init__(self, quiet_period=1.0, max_latency=10.0):
+        """
+        参数:
+            quiet_period: 突发结束的判定时间(秒)
+            max_latency: 一批变化从第一个事件到交出的最长等待时间(秒)
+        """
+        self.quiet_period = quiet_period
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        self._pending = {}
+        self._events = 0
+        self._first = None
+        self._last = None
+        self._last_event = None
+    
+    def add(self, key, change, event=None):
+        """记录一条变化，key相同的旧记录被替换"""
+        now = time.monotonic()
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = change
+            self._events += 1
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self._last_event = event
+    
+    def delay(self):
+        """距离本批变化可以交出还需等待的秒数，没有变化时返回None"""
+        with self._lock:
+            if not self._pending:
+                return None
+            due = min(self._last + self.quiet_period, self._first + self.max_latency)
+            return max(0.0, due - time.monotonic())
+    
+    def pending(self):
+        """返回尚未交出的变化记录"""
+        with self._lock:
+            return list(self._pending.values())
+    
+    def take(self):
+        """
+        取出本批变化
+        
+        返回:
+            tuple: (变化记录列表, 合并的事件数, 最后一个事件)
+        """
+        with self._lock:
+            batch = (list(self._pending.values()), self._events, self._last_event)
+            self._reset()
+            return batch
+
+class SettleTracker:
+    """
+    判断文件是否已经写完
+    
+    文件的大小和修改时间保持 settle_time 秒不变，或者收到关闭写入事件(Linux的IN_CLOSE_WRITE)后
+    才视为写完。还在写入的文件放入待定集合，到期时再检查一次，而不是每个修改事件都复制一次。
+    
+    保持不变的时间从第一次观察到当前的大小和修改时间算起；cp -p、rsync -t和解压会保留旧的修改时间，
+    所以只有修改时间晚于第一次观察的时刻(文件在观察期间被写入)时，才按修改时间推算已保持不变的时间。
+    """
+    
+    def __init__(self, source_folder, settle_time=2.0):
+        """
+        参数:
+            source_folder: 源文件夹，变化记录中的路径相对于它
+            settle_time: 文件保持不变多少秒后视为写完
+        """
+        self.source_folder = source_folder
+        self.settle_time = settle_time
+        # 相对路径 -> (变化记录, 大小, 修改时间(纳秒), 开始保持不变的时刻, 第一次观察的时间戳)
+        self._pending = {}
+        self._closed = set()
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def paths(self):
+        """返回写入中的文件"""
+        return list(self._pending)
+    
+    def closed(self, rel_path):
+        """记录文件的关闭写入事件"""
+        self._closed.add(rel_path)
+    
+    def touched(self, rel_path):
+        """文件又被写入，之前的关闭事件作废"""
+        self._closed.discard(rel_path)
+    
+    def split(self, changes):
+        """
+        从一批变化中取出可以同步的部分，写入中的文件留在待定集合
+        
+        返回:
+            list: 可以同步的变化记录
+        """
+        now = time.monotonic()
+        return [change for change in changes
+                if change[0] != 'modified' or self._settled(change[1], change, now)]
+    
+    def due(self):
+        """重新检查已到期的待定文件，返回其中已写完的变化记录"""
+        now = time.monotonic()
+        ready = []
+        for rel_path, (change, _, _, since, _) in list(self._pending.items()):
+            if now - since >= self.settle_time and self._settled(rel_path, change, now):
+                ready.append(change)
+        return ready
+    
+    def delay(self):
+        """距离下一个待定文件到期的秒数，没有待定文件时返回None"""
+        if not self._pending:
+            return None
+        since = min(state[3] for state in self._pending.values())
+        return max(0.0, since + self.settle_time - time.monotonic())
+    
+    def _settled(self, rel_path, change, now):
+        if rel_path in self._closed:
+            self._closed.discard(rel_path)
+            self._pending.pop(rel_path, None)
+            return True
+        try:
+            file_stat = os.stat(os.path.join(self.source_folder, rel_path))
+        except OSError:
+            # 已删除的路径由同步处理
+            self._pending.pop(rel_path, None)
+            return True
+        if stat.S_ISDIR(file_stat.st_mode):
+            return True
+        
+        state = (file_stat.st_size, file_stat.st_mtime_ns)
+        previous = self._pending.get(rel_path)
+        if previous is None:
+            first_seen = time.time()
+            since = now
+        else:
+            first_seen = previous[4]
+            if previous[1:3] == state:
+                since = previous[3]
+            elif file_stat.st_mtime_ns / 1e9 > first_seen:
+                # 修改时间是观察期间写入产生的，可以从最后一次写入的时刻算起
+                since = now - max(0.0, time.time() - file_stat.st_mtime_ns / 1e9)
+            else:
+                since = now
+        if now - since >= self.settle_time:
+            self._pending.pop(rel_path, None)
+            return True
+        self._pending[rel_path] = (change,) + state + (since, first_seen)
+        return False
+
+class SyncWorker(threading.Thread):
+    """
+    专用的同步线程，与watchdog的观察者线程分离
+    
+    事件回调只把事件放入队列；本线程负责过滤和合并事件并执行同步。
+    同步只在本线程中执行，因此同一时间最多一次同步在运行；同步期间到达的事件
+    留在合并队列中(相当于"脏"标记)，当前同步结束后再合并为下一次同步。
+    """
+    
+    def __init__(self, watcher):
+        super().__init__(name="huangyz-sync-worker", daemon=True)
+        self.watcher = watcher
+        self.events = queue.Queue()
+        self.coalescer = ChangeCoalescer(watcher.quiet_period, watcher.max_latency)
+        self.settle = SettleTracker(watcher.source_folder, watcher.settle_time) if watcher.settle_time > 0 else None
+        self._last_event = None
+        self._reported_pending = 0
+        # 因事件溢出需要重新扫描的目录
+        self.rescans = set()
+        # 同步失败的路径，之后的同步成功处理之前一直算作未同步
+        self.failed = set()
+        self._next_check = time.monotonic() + OBSERVER_CHECK_INTERVAL
+        self._next_checkpoint = time.monotonic() + watcher.checkpoint_interval
+    
+    def submit(self, event):
+        """在观察者线程中调用，只做入队"""
+        self.events.put(event)
+    
+    def stop(self):
+        """停止线程，尚未同步的变化被丢弃，涉及的路径记录在watcher.unsynced中"""
+        self.events.put(None)
+        self.join()
+    
+    def run(self):
+        while True:
+            now = time.monotonic()
+            if now >= self._next_check:
+                # 观察者线程意外退出后事件会全部丢失
+                self._next_check = now + OBSERVER_CHECK_INTERVAL
+                try:
+                    self.watcher.check_observer()
+                except Exception as e:
+                    print(f"检查文件监视状态时出错: {e}")
+            delay = self.coalescer.delay()
+            if self.settle is not None:
+                settle_delay = self.settle.delay()
+                if settle_delay is not None:
+                    delay = settle_delay if delay is None else min(delay, settle_delay)
+            if delay == 0:
+                # 先交出到期的一批，持续的事件流不会让同步无限推迟
+                self.flush()
+                continue
+            timeout = max(0.0, self._next_check - now)
+            if self.watcher.checkpoint is not None and delay is None:
+                # 没有待同步的变化时才保存检查点
+                if now >= self._next_checkpoint:
+                    self._next_checkpoint = now + self.watcher.checkpoint_interval
+                    try:
+                        self.watcher.checkpoint(self.unsynced_paths)
+                    except Exception as e:
+                        print(f"保存同步状态时出错: {e}")
+                    continue
+                timeout = min(timeout, self._next_checkpoint - now)
+            if delay is not None:
+                timeout = min(timeout, delay)
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if event is None:
+                self.watcher.unsynced = self.unsynced_paths()
+                return
+            try:
+                self.record(event)
+            except Exception as e:
+                print(f"处理文件变化事件时出错: {e}")
+    
+    def unsynced_paths(self):
+        """
+        在本线程中调用，返回尚未同步的相对路径
+        
+        先处理队列中已到达的事件，再汇总合并队列、写入中的文件和待重新扫描的目录。
+        """
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                # 停止标记留给run处理
+                self.events.put(None)
+                break
+            try:
+                self.record(event)
+            except Exception as e:
+                print(f"处理文件变化事件时出错: {e}")
+        
+        paths = set(self.rescans) | self.failed
+        for _, rel_path, dest_rel_path in self.coalescer.pending():
+            paths.add(rel_path)
+            if dest_rel_path:
+                paths.add(dest_rel_path)
+        if self.settle is not None:
+            paths.update(self.settle.paths())
+        return sorted(paths)
+    
+    def record(self, event):
+        """过滤事件并加入合并队列"""
+        change = self.watcher.event_change(event)
+        if change is None:
+            return
+        if event.event_type == 'overflow':
+            # 事件队列溢出，对受影响的目录重新扫描
+            print(f"文件变化事件溢出，将重新扫描: {event.src_path}")
+            self.watcher.stats['overflow_events'] += 1
+            self.rescans.add(change[1])
+            self.coalescer.add(change[1:], change, event)
+            return
+        
+        # 嵌套忽略文件变化后，之后的检查使用新的规则
+        ignore_rules = self.watcher.ignore_rules
+        if ignore_rules and ignore_rules.nested_file and \
+                os.path.basename(event.src_path) == ignore_rules.nested_file:
+            ignore_rules.refresh()
+        
+        # 忽略隐藏文件/目录
+        if os.path.basename(event.src_path).startswith('.') and change[0] != 'moved':
+            return
+        
+        # 检查是否应该忽略
+        if ignore_rules and change[0] != 'moved':
+            if ignore_rules.should_ignore(change[1], event.is_directory):
+                print(f"忽略变化: {event.event_type} - {event.src_path}")
+                return
+        
+        if self.settle is not None and not event.is_directory:
+            if event.event_type == 'closed':
+                self.settle.closed(change[1])
+            else:
+                self.settle.touched(change[1])
+        self.coalescer.add(change[1:], change, event)
+    
+    def _track_failures(self, changes, rescans, result):
+        """更新同步失败的路径；整次同步出错时本次涉及的路径都算作失败"""
+        touched = set(rescans)
+        for _, rel_path, dest_rel_path in changes:
+            touched.add(rel_path)
+            if dest_rel_path:
+                touched.add(dest_rel_path)
+        if result is None:
+            self.failed |= touched
+            return
+        self.failed -= touched
+        self.failed.update(result.get("failed", ()))
+    
+    def flush(self):
+        """执行一次同步"""
+        changes, event_count, event = self.coalescer.take()
+        rescans, self.rescans = self.rescans, set()
+        if event is not None:
+            self._last_event = event
+        if changes:
+            print(f"检测到变化: 合并了 {event_count} 个事件，共 {len(changes)} 项变化")
+        if self.settle is not None:
+            changes = self.settle.split(changes)
+            ready = self.settle.due()
+            if ready:
+                print(f"{len(ready)} 个文件已写入完成")
+                changes.extend(ready)
+            if len(self.settle) != self._reported_pending:
+                self._reported_pending = len(self.settle)
+                if self._reported_pending:
+                    print(f"{self._reported_pending} 个文件仍在写入，写入完成后再同步")
+        if not changes:
+            return
+        try:
+            # 如果设置了要同步
+            if self.watcher.sync_on_change:
+                print("正在同步变更...")
+                result = self.watcher.sync_changes(changes, rescans)
+                self._track_failures(changes, rescans, result)
+            
+            # 如果有自定义回调，调用它
+            if self.watcher.callback:
+                self.watcher.callback(self._last_event)
+        except Exception as e:
+            print(f"同步变更时出错: {e}")
+
+class WatchHub:
+    """
+    进程内共享的文件监视中心
+    
+    所有订阅共用一个观察者线程：相互包含的目录只向观察者注册最外层的一个，
+    事件按路径前缀在目录树(trie)中查找订阅了该路径或其上级目录的处理器，
+    再投递到各任务自己的队列。
+    """
+    
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    def __init__(self, backend="auto"):
+        """
+        参数:
+            backend: 监视后端，'watchdog'、'inotify' 或 'auto'(优先watchdog)
+        """
+        if backend == "auto":
+            backend = "watchdog" if WATCHDOG_AVAILABLE else "inotify"
+        if backend == "watchdog" and not WATCHDOG_AVAILABLE:
+            raise ImportError("请先安装watchdog库: pip install watchdog")
+        if backend == "inotify" and not INOTIFY_AVAILABLE:
+            raise ImportError("当前系统不支持inotify，请安装watchdog库: pip install watchdog")
+        self.backend = backend
+        self.observer = None
+        self._lock = threading.RLock()
+        # 路径组成部分 -> 子节点，键None保存订阅列表 [(处理器, 是否递归)]
+        self._trie = {}
+        # 订阅的目录 -> trie中的订阅列表
+        self._subscriptions = {}
+        # 向观察者注册的目录 -> (是否递归, 观察者返回的监视对象)
+        self._watches = {}
+    
+    @classmethod
+    def shared(cls):
+        """返回进程内共享的监视中心"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
+    @staticmethod
+    def _parts(path):
+        return [part for part in os.path.normpath(path).split(os.sep) if part]
+    
+    def _node(self, path, create=False):
+        node = self._trie
+        for part in self._parts(path):
+            child = node.get(part)
+            if child is None:
+                if not create:
+                    return None
+                child = node[part] = {}
+            node = child
+        return node
+    
+    def subscribe(self, path, handler, recursive=True):
+        """
+        订阅目录的文件变化事件
+        
+        参数:
+            path: 要监视的目录
+            handler: 有dispatch方法的事件处理器，在观察者线程中调用，应只做入队
+            recursive: 是否包括子目录
+        
+        返回:
+            tuple: 传给unsubscribe的订阅标识
+        """
+        path = os.path.abspath(path)
+        subscription = (handler, recursive)
+        with self._lock:
+            subscriptions = self._node(path, create=True).setdefault(None, [])
+            subscriptions.append(subscription)
+            self._subscriptions[path] = subscriptions
+            try:
+                self._rebalance()
+            except Exception:
+                self._remove(path, subscription)
+                raise
+        return (path, subscription)
+    
+    def unsubscribe(self, token):
+        """取消订阅，没有订阅时停止观察者"""
+        path, subscription = token
+        with self._lock:
+            if subscription not in self._subscriptions.get(path, ()):
+                return
+            self._remove(path, subscription)
+            self._rebalance()
+    
+    def _remove(self, path, subscription):
+        """删除订阅，并删除不再有订阅的trie分支"""
+        self._subscriptions[path].remove(subscription)
+        if not self._subscriptions[path]:
+            del self._subscriptions[path]
+        nodes = [self._trie]
+        parts = self._parts(path)
+        for part in parts:
+            nodes.append(nodes[-1][part])
+        for index in range(len(parts), 0, -1):
+            node = nodes[index]
+            if node.get(None) == []:
+                del node[None]
+            if node:
+                break
+            del nodes[index - 1][parts[index - 1]]
+    
+    def _covered(self, path):
+        """路径是否已在某个上级目录的递归订阅之内"""
+        node = self._trie
+        for part in self._parts(path)[:-1]:
+            node = node[part]
+            if any(recursive for _, recursive in node.get(None, ())):
+                return True
+        return False
+    
+    def _rebalance(self):
+        """使观察者注册的目录与订阅一致：只注册不被其他递归订阅包含的目录"""
+        wanted = {path: any(recursive for _, recursive in subscriptions)
+                  for path, subscriptions in self._subscriptions.items() if not self._covered(path)}
+        if not wanted:
+            self._stop_observer()
+            return
+        if self.observer is None:
+            self.observer = Observer() if self.backend == "watchdog" else InotifyObserver()
+            self.observer.start()
+        
+        # 先注册新的目录再取消被包含的目录，切换期间不会漏掉事件
+        for path, recursive in wanted.items():
+            current = self._watches.get(path)
+            if current is not None and current[0] == recursive:
+                continue
+            self._watches[path] = (recursive, self.observer.schedule(self, path, recursive=recursive))
+            if current is not None:
+                self.observer.unschedule(current[1])
+        for path in [path for path in self._watches if path not in wanted]:
+            self.observer.unschedule(self._watches.pop(path)[1])
+    
+    def check(self):
+        """
+        观察者线程意外退出时重新创建观察者，并让所有订阅者重新扫描各自的目录
+        
+        返回:
+            bool: 观察者是否正常运行(或没有订阅)
+        """
+        with self._lock:
+            if self.observer is None or observer_alive(self.observer):
+                return True
+            print("文件监视线程已退出，正在重新启动")
+            self.observer.stop()
+            self.observer.join(1)
+            self.observer = Observer() if self.backend == "watchdog" else InotifyObserver()
+            watches, self._watches = self._watches, {}
+            for path, (recursive, _) in watches.items():
+                try:
+                    self._watches[path] = (recursive, self.observer.schedule(self, path, recursive=recursive))
+                except OSError as e:
+                    print(f"无法重新监视目录 {path}: {e}")
+            self.observer.start()
+            for path in self._watches:
+                self.dispatch(InotifyEvent('overflow', path, True))
+            return False
+    
+    def _stop_observer(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        self._watches.clear()
+    
+    def _handlers(self, path):
+        """查找订阅了path或其上级目录的处理器"""
+        parts = self._parts(path)
+        handlers = []
+        node = self._trie
+        for depth in range(len(parts) + 1):
+            for handler, recursive in node.get(None, ()):
+                # 非递归订阅只接收目录本身和直接子条目的事件
+                if recursive or depth >= len(parts) - 1:
+                    handlers.append(handler)
+            if depth == len(parts):
+                break
+            node = node.get(parts[depth])
+            if node is None:
+                break
+        return handlers
+    
+    def _subtree_handlers(self, path):
+        """查找订阅了path之下目录的处理器，返回 [(订阅的目录, 处理器)]"""
+        node = self._node(path)
+        found = []
+        if node is None:
+            return found
+        stack = [(node, path)]
+        while stack:
+            node, current = stack.pop()
+            if current != path:
+                found.extend((current, handler) for handler, _ in node.get(None, ()))
+            for part, child in node.items():
+                if part is not None:
+                    stack.append((child, os.path.join(current, part)))
+        return found
+    
+    def dispatch(self, event):
+        """观察者回调，按路径把事件投递给订阅者"""
+        with self._lock:
+            targets = [(handler, event) for handler in self._handlers(event.src_path)]
+            if event.event_type == 'overflow':
+                # 溢出的范围包括注册目录下的所有订阅，各自重新扫描自己的目录
+                targets.extend((handler, InotifyEvent('overflow', path, True))
+                               for path, handler in self._subtree_handlers(event.src_path))
+            elif event.event_type == 'moved':
+                # 从一个订阅移入另一个订阅时，对目标订阅相当于新建
+                receivers = set(id(handler) for handler, _ in targets)
+                created = InotifyEvent('created', event.dest_path, event.is_directory)
+                targets.extend((handler, created) for handler in self._handlers(event.dest_path)
+                               if id(handler) not in receivers)
+        for handler, routed in targets:
+            try:
+                handler.dispatch(routed)
+            except Exception as e:
+                print(f"处理文件变化事件时出错: {e}")
 
 class FolderWatcher:
     """文件夹监视器 - 监视文件夹变化并执行操作"""
     
     def __init__(self, source_folder, target_folder=None, sync_on_change=False, 
-                 callback=None, auto_start=False, recursive=True, ignore_rules=None):
+                 callback=None, auto_start=False, recursive=True, ignore_rules=None, scheduler=None,
+                 incremental=True, full_sync_interval=3600, max_pending_changes=10000,
+                 quiet_period=1.0, max_latency=10.0, backend="auto", hub=None, settle_time=2.0,
+                 checkpoint=None, checkpoint_interval=600):
         """
         初始化文件夹监视器
         
@@ -28,18 +659,56 @@ class FolderWatcher:
             auto_start: 是否自动启动监视
             recursive: 是否递归监视子文件夹
             ignore_rules: IgnoreRules对象、忽略规则文件路径或规则列表
+            scheduler: 可选的SyncScheduler，决定同步时文件的处理顺序
+            incremental: 是否只同步事件涉及的路径；为False时每次都同步整个目录
+            full_sync_interval: 增量模式下完整同步(校正遗漏的事件)的最小间隔(秒)
+            max_pending_changes: 累积的变化超过该数量时视为事件溢出，改为重新扫描变化所在的子目录
+            quiet_period: 最后一个事件之后等待多久(秒)没有新事件才开始同步，一次突发只同步一次
+            max_latency: 持续有事件时，最多等待多久(秒)也要同步一次
+            backend: 监视后端，'watchdog'、'inotify'(Linux内置，不依赖watchdog) 或 'auto'(优先watchdog)
+            hub: 可选的WatchHub，多个监视器共用其观察者；使用时backend由hub决定
+            settle_time: 文件的大小和修改时间保持多少秒不变才同步(Linux上收到关闭写入事件时立即同步)，
+                正在写入的文件不会被反复复制；0表示不等待
+            checkpoint: 可选的回调 checkpoint(unsynced_paths)，没有待同步的变化时在同步线程中定期调用，
+                用于保存同步状态；unsynced_paths() 返回此时尚未同步的相对路径
+            checkpoint_interval: 调用checkpoint的最小间隔(秒)
         """
-        if not WATCHDOG_AVAILABLE:
+        if hub is not None:
+            backend = hub.backend
+        elif backend == "auto":
+            backend = "watchdog" if WATCHDOG_AVAILABLE else "inotify"
+        if backend == "watchdog" and not WATCHDOG_AVAILABLE:
             raise ImportError("请先安装watchdog库: pip install watchdog")
+        if backend == "inotify" and not INOTIFY_AVAILABLE:
+            raise ImportError("当前系统不支持inotify，请安装watchdog库: pip install watchdog")
+        self.backend = backend
+        self.hub = hub
+        self._subscription = None
         
         self.source_folder = os.path.abspath(source_folder)
+        self._source_prefix = os.path.join(self.source_folder, '')
         self.target_folder = os.path.abspath(target_folder) if target_folder else None
         self.sync_on_change = sync_on_change
         self.callback = callback
         self.recursive = recursive
+        self.scheduler = scheduler
+        self.incremental = incremental
+        self.full_sync_interval = full_sync_interval
+        self.max_pending_changes = max_pending_changes
+        self.quiet_period = quiet_period
+        self.max_latency = max_latency
+        self.settle_time = settle_time
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        # 停止监视时尚未同步的相对路径
+        self.unsynced = []
+        self.last_full_sync = time.time()
         self.observer = None
         self.running = False
         self.event_handler = None
+        self.worker = None
+        # 事件溢出/丢失的次数和重新扫描的子目录数
+        self.stats = {'overflow_events': 0, 'rescans': 0, 'observer_restarts': 0}
         
         # 处理忽略规则
         if ignore_rules:
@@ -64,6 +733,123 @@ class FolderWatcher:
         if auto_start:
             self.start()
     
+    def relative_path(self, path):
+        """
+        把事件路径转换为相对源文件夹的路径
+        
+        事件路径都位于源文件夹之下，直接去掉前缀，避免os.path.relpath每次对两个路径取绝对路径
+        """
+        if path.startswith(self._source_prefix):
+            return path[len(self._source_prefix):]
+        return os.path.relpath(path, self.source_folder)
+    
+    def event_change(self, event):
+        """
+        把watchdog事件转换为sync_paths使用的变化记录
+        
+        返回:
+            tuple: (类型, 相对路径, 移动后的相对路径)，不需要同步的事件返回None
+        """
+        rel_path = self.relative_path(event.src_path)
+        if event.event_type == 'moved':
+            # 目录移动时watchdog为其中每个条目补发的事件已包含在目录的重命名中
+            if getattr(event, 'is_synthetic', False):
+                return None
+            dest_rel_path = self.relative_path(event.dest_path)
+            # 移出监视目录等同于删除
+            if dest_rel_path.startswith('..'):
+                return ('deleted', rel_path, None)
+            return ('moved', rel_path, dest_rel_path)
+        if event.event_type == 'deleted':
+            return ('deleted', rel_path, None)
+        if event.event_type == 'overflow':
+            # 目录的同步记录会重新扫描整个子树
+            return ('modified', rel_path, None)
+        if event.event_type in ('created', 'modified', 'closed'):
+            # 目录的修改事件只表示其中的条目有变化，条目本身会有各自的事件
+            if event.is_directory and event.event_type != 'created':
+                return None
+            return ('modified', rel_path, None)
+        return None
+    
+    def watch_stats(self):
+        """
+        返回事件溢出和重新扫描的统计
+        
+        返回:
+            dict: overflow_events(溢出或丢失事件的次数)、rescans(重新扫描的子目录数)、
+                  observer_restarts(观察者线程退出后重新启动的次数)
+        """
+        return dict(self.stats)
+    
+    def check_observer(self):
+        """观察者线程意外退出(如watchdog读取事件出错)时重新启动，并重新扫描整个源文件夹"""
+        if not self.running:
+            return
+        if self.hub is not None:
+            if not self.hub.check():
+                self.stats['observer_restarts'] += 1
+            return
+        if self.observer is None or observer_alive(self.observer):
+            return
+        print(f"文件监视线程已退出，正在重新启动: {self.source_folder}")
+        self.observer.stop()
+        self.observer.join(1)
+        observer = Observer() if self.backend == "watchdog" else InotifyObserver()
+        try:
+            observer.schedule(self.event_handler, self.source_folder, recursive=self.recursive)
+            observer.start()
+        except OSError as e:
+            print(f"重新启动文件监视失败: {e}")
+            return
+        self.observer = observer
+        self.stats['observer_restarts'] += 1
+        self.worker.submit(InotifyEvent('overflow', self.source_folder, True))
+    
+    def sync_changes(self, changes, rescans=()):
+        """
+        同步累积的变化
+        
+        增量模式下只处理变化的路径，rescans中的目录(事件溢出的范围)整个重新扫描；
+        变化数量超过max_pending_changes(视为事件溢出)时合并为少量子目录重新扫描；
+        距上次完整同步超过full_sync_interval时执行完整同步
+        """
+        from ..core.sync import sync_directories, sync_paths
+        
+        now = time.time()
+        if not self.incremental or now - self.last_full_sync >= self.full_sync_interval:
+            if self.incremental:
+                print(f"执行完整同步以校正遗漏的变化 (累积 {len(changes)} 项变化)")
+            self.last_full_sync = now
+            self.stats['rescans'] += len(rescans)
+            return sync_directories(
+                self.source_folder,
+                self.target_folder,
+                delete_extra=True,
+                ignore_rules=self.ignore_rules,
+                scheduler=self.scheduler
+            )
+        
+        if len(changes) > self.max_pending_changes:
+            self.stats['overflow_events'] += 1
+            count = len(changes)
+            changes = collapse_changes(changes)
+            rescans = set(rel_path for _, rel_path, _ in changes)
+            print(f"累积 {count} 项变化超过上限，改为重新扫描 {len(changes)} 个子目录")
+        elif rescans:
+            # 重新扫描的目录中的其他变化不需要单独处理
+            changes = [change for change in changes
+                       if change[0] == 'moved' or change[1] in rescans or not _within(change[1], rescans)]
+        self.stats['rescans'] += len(rescans)
+        return sync_paths(
+            self.source_folder,
+            self.target_folder,
+            changes,
+            delete_extra=True,
+            ignore_rules=self.ignore_rules,
+            scheduler=self.scheduler
+        )
+    
     def start(self):
         """启动文件夹监视"""
         if self.running:
@@ -72,77 +858,39 @@ class FolderWatcher:
             
         try:
             # 创建一个自定义事件处理器
-            class ChangeHandler(FileSystemEventHandler):
-                def __init__(self, watcher):
-                    self.watcher = watcher
-                    self.processing = False
-                    # 添加一个小延迟避免同一变化多次触发
-                    self.last_processed = time.time()
-                    
-                def on_any_event(self, event):
-                    # 忽略目录创建事件，因为这些通常会伴随文件创建事件
-                    if event.is_directory and event.event_type == 'created':
-                        return
-                        
-                    # 忽略隐藏文件/目录
-                    if os.path.basename(event.src_path).startswith('.'):
-                        return
+            class ChangeHandler:
+                """事件处理器，watchdog和inotify观察者都通过dispatch投递事件"""
+                
+                def __init__(self, worker):
+                    self.worker = worker
                     
-                    # 检查是否应该忽略
-                    if self.watcher.ignore_rules:
-                        # 获取相对路径用于检查
-                        rel_path = os.path.relpath(
-                            event.src_path, self.watcher.source_folder)
-                        if self.watcher.ignore_rules.should_ignore(
-                            rel_path, event.is_directory):
-                            print(f"忽略变化: {event.event_type} - {event.src_path}")
-                            return
-                        
-                    # 添加一个小延迟避免频繁触发
-                    current_time = time.time()
-                    if current_time - self.last_processed < 1:  # 1秒内不重复处理
-                        return
-                        
-                    self.last_processed = current_time
-                    
-                    # 如果正在处理，不再触发新事件
-                    if self.processing:
-                        return
-                        
-                    self.processing = True
-                    try:
-                        print(f"检测到变化: {event.event_type} - {event.src_path}")
-                        
-                        # 如果设置了要同步
-                        if self.watcher.sync_on_change:
-                            print("正在同步变更...")
-                            from ..core.sync import sync_directories
-                            sync_directories(
-                                self.watcher.source_folder, 
-                                self.watcher.target_folder,
-                                delete_extra=True,
-                                ignore_rules=self.watcher.ignore_rules
-                            )
-                                
-                        # 如果有自定义回调，调用它
-                        if self.watcher.callback:
-                            self.watcher.callback(event)
-                    finally:
-                        self.processing = False
+                def dispatch(self, event):
+                    # 在观察者线程中只做入队，过滤、合并和同步都在同步线程中进行
+                    self.worker.submit(event)
             
-            # 创建事件处理器实例
-            self.event_handler = ChangeHandler(self)
+            # 启动同步线程和事件处理器
+            self.worker = SyncWorker(self)
+            self.worker.start()
+            self.event_handler = ChangeHandler(self.worker)
             
-            # 创建观察者
-            self.observer = Observer()
-            self.observer.schedule(
-                self.event_handler, 
-                self.source_folder, 
-                recursive=self.recursive
-            )
-            
-            # 启动观察者
-            self.observer.start()
+            if self.hub is not None:
+                # 使用共享的观察者
+                self._subscription = self.hub.subscribe(
+                    self.source_folder,
+                    self.event_handler,
+                    recursive=self.recursive
+                )
+            else:
+                # 创建观察者
+                self.observer = Observer() if self.backend == "watchdog" else InotifyObserver()
+                self.observer.schedule(
+                    self.event_handler, 
+                    self.source_folder, 
+                    recursive=self.recursive
+                )
+                
+                # 启动观察者
+                self.observer.start()
             self.running = True
             print(f"开始监视文件夹: {self.source_folder}")
             if self.sync_on_change:
@@ -156,6 +904,9 @@ class FolderWatcher:
             if self.observer:
                 self.observer.stop()
                 self.observer = None
+            if self.worker:
+                self.worker.stop()
+                self.worker = None
             self.running = False
             return False
     
@@ -166,11 +917,21 @@ class FolderWatcher:
             return False
             
         try:
-            self.observer.stop()
-            self.observer.join()  # 等待观察者线程终止
-            self.observer = None
+            if self._subscription is not None:
+                self.hub.unsubscribe(self._subscription)
+                self._subscription = None
+            else:
+                self.observer.stop()
+                self.observer.join()  # 等待观察者线程终止
+                self.observer = None
+            if self.worker:
+                self.worker.stop()
+                self.worker = None
             self.running = False
             print(f"停止监视文件夹: {self.source_folder}")
+            if self.stats['overflow_events'] or self.stats['observer_restarts']:
+                print(f"事件溢出 {self.stats['overflow_events']} 次，监视线程重启 {self.stats['observer_restarts']} 次，"
+                      f"重新扫描子目录 {self.stats['rescans']} 个")
             return True
         except Exception as e:
             print(f"停止文件夹监视时出错: {e}")
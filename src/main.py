@@ -12,6 +12,17 @@ from pathlib import Path
 from huangyz_sync.models.config import SyncConfigManager
 from huangyz_sync.core.sync import sync_directories, AutoSync
 from huangyz_sync.utils.ignore import IgnoreRules
+from huangyz_sync.core.repository import ChunkRepository
+
+def positive_int(value):
+    """argparse类型：正整数"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是整数: {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须大于0: {value}")
+    return number
 
 def main():
     parser = argparse.ArgumentParser(description="huangyz_sync 文件同步工具")
@@ -26,6 +37,8 @@ def main():
     sync_parser.add_argument("--source", "-s", help="源目录路径（直接同步模式）")
     sync_parser.add_argument("--target", "-d", help="目标目录路径（直接同步模式）")
     sync_parser.add_argument("--delete", action="store_true", help="是否删除目标目录中多余的文件")
+    sync_parser.add_argument("--jobs", "-j", type=positive_int, default=1, help="同时执行的任务数（配置文件模式）")
+    sync_parser.add_argument("--jobs-per-device", type=positive_int, default=1, help="同一磁盘上同时执行的任务数")
     
     # watch 子命令
     watch_parser = subparsers.add_parser("watch", help="监视文件夹并自动同步")
@@ -35,6 +48,14 @@ def main():
     watch_parser.add_argument("--target", "-d", help="目标目录路径（直接监视模式）")
     watch_parser.add_argument("--interval", "-i", type=int, default=60, help="同步间隔（秒）")
     
+    # restore 子命令
+    restore_parser = subparsers.add_parser("restore", help="从去重仓库恢复快照")
+    restore_parser.add_argument("--repo", "-r", required=True, help="去重仓库目录")
+    restore_parser.add_argument("--target", "-d", help="恢复到的目录")
+    restore_parser.add_argument("--snapshot", help="要恢复的快照ID，不指定则恢复最新快照")
+    restore_parser.add_argument("--paths", "-p", nargs="*", help="只恢复指定的相对路径")
+    restore_parser.add_argument("--list", "-l", action="store_true", help="列出仓库中的所有快照")
+    
     # 解析命令行参数
     args = parser.parse_args()
     
@@ -49,9 +70,9 @@ def main():
             # 使用配置文件执行同步
             config_manager = SyncConfigManager(args.config)
             if args.tasks:
-                config_manager.run_tasks(args.tasks)
+                config_manager.run_tasks(args.tasks, jobs=args.jobs, jobs_per_device=args.jobs_per_device)
             else:
-                config_manager.run_tasks()
+                config_manager.run_tasks(jobs=args.jobs, jobs_per_device=args.jobs_per_device)
         elif args.source and args.target:
             # 直接执行同步
             print(f"直接同步: {args.source} -> {args.target}")
@@ -90,6 +111,24 @@ def main():
         else:
             print("错误: 必须提供配置文件和任务名称，或源目录和目标目录")
             watch_parser.print_help()
+    
+    # 处理 restore 命令
+    elif args.command == "restore":
+        if not os.path.isdir(args.repo):
+            print(f"错误: 仓库目录不存在: {args.repo}")
+            return
+        if not os.path.exists(os.path.join(args.repo, ChunkRepository.CONFIG_FILE)):
+            print(f"错误: 目录不是去重仓库(缺少{ChunkRepository.CONFIG_FILE}): {args.repo}")
+            return
+        repository = ChunkRepository(args.repo)
+        if args.list:
+            for snapshot_id in repository.list_snapshots():
+                print(snapshot_id)
+        elif args.target:
+            repository.restore(args.target, snapshot_id=args.snapshot, paths=args.paths)
+        else:
+            print("错误: 必须提供恢复目标目录")
+            restore_parser.print_help()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file